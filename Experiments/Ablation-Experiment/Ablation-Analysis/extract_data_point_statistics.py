@@ -1,60 +1,112 @@
+import os
 import sys
 import csv
+import argparse
 import numpy as np
 
 import pyarrow
 from pyarrow import flight
+import pyarrow.compute as pc
 
-PMC_SENTINEL_VALUE = "-999.0"
-SWING_SENTINEL_VALUE = "999.0"
-SELECT_ONE_QUERY = "SELECT * FROM {} LIMIT 1;"
-CNT_GORILLA_QUERY = "SELECT COUNT(timestamp) FROM {} WHERE {} <> {} AND {} <> {}"
-CNT_PMC_QUERY = "SELECT COUNT(timestamp) FROM {} WHERE {} == " + PMC_SENTINEL_VALUE
-CNT_SWING_QUERY = "SELECT COUNT(timestamp) FROM {} WHERE {} == " + SWING_SENTINEL_VALUE
+# The helpers for reading query results are shared with the other scripts.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir, "Utilities"))
+import flight_results
 
-CNT_QUERIES = {"gorilla" : CNT_GORILLA_QUERY, "pmc" : CNT_PMC_QUERY, "swing": CNT_SWING_QUERY,}
+# The values written instead of the data points for each model type, as a SQL literal and as a value
+SENTINEL_VALUES = {
+    "pmc": ("-999.0", -999.0),
+    "swing": ("999.0", 999.0),
+}
+SELECT_ONE_QUERY = "SELECT * FROM {} LIMIT 1;"
+SUM_CASE = "SUM(CASE WHEN {} THEN 1 ELSE 0 END)"
 
 def get_safe_col_name(col_name):
     return col_name.lower().replace(" ", "_")
 
 
+def get_model_type_conditions(column_name):
+    # Data points that are not a sentinel value are compressed by Gorilla
+    conditions = {"gorilla": " AND ".join(f"{column_name} <> {literal}" for literal, _ in SENTINEL_VALUES.values())}
+    for model_type, (literal, _) in SENTINEL_VALUES.items():
+        conditions[model_type] = f"{column_name} == {literal}"
+    return conditions
+
+
+def get_model_type_masks(values):
+    masks = {"gorilla": None}
+    for model_type, (_, value) in SENTINEL_VALUES.items():
+        not_sentinel_mask = pc.not_equal(values, value)
+        masks["gorilla"] = not_sentinel_mask if masks["gorilla"] is None else pc.and_(masks["gorilla"], not_sentinel_mask)
+        masks[model_type] = pc.equal(values, value)
+    return masks
+
+
+def count_on_server(flight_client, dataset, column_names):
+    # The data points of all model types and columns are counted in one scan of the model table
+    sums = []
+    for column_name in column_names:
+        sums.extend(SUM_CASE.format(condition) for condition in get_model_type_conditions(column_name).values())
+    result = flight_results.read_table(flight_client, f"SELECT {', '.join(sums)} FROM {dataset}")
+
+    # SUM is NULL instead of 0 if the model table is empty
+    return [column[0].as_py() or 0 for column in result.columns]
+
+
+def count_on_client(flight_client, dataset, column_names):
+    # The model table is streamed once and the sentinel values are counted in each batch
+    counts = [0] * (len(column_names) * (len(SENTINEL_VALUES) + 1))
+    flight_stream_reader = flight_results.do_get(flight_client, f"SELECT {', '.join(column_names)} FROM {dataset}")
+    for record_batch in flight_results.read_record_batches(flight_stream_reader):
+        index = 0
+        for column_name in column_names:
+            for mask in get_model_type_masks(record_batch.column(column_name)).values():
+                counts[index] += pc.sum(mask).as_py() or 0
+                index += 1
+    return counts
+
+
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print(f"Usage: {sys.argv[0]} dataset error_bound coefficient")
-        sys.exit(0)
-
-    dataset=sys.argv[1]
-    error=float(sys.argv[2])
-    coefficient=sys.argv[3]
-    
-    flight_client = flight.FlightClient("grpc://127.0.0.1:9999") 
-    ticket = flight.Ticket(SELECT_ONE_QUERY.format(dataset))
-    flight_stream_reader = flight_client.do_get(ticket)
-    column_names = None
-    for flight_stream_chunk in flight_stream_reader:
-        record_batch = flight_stream_chunk.data
-        column_names = pyarrow.Table.from_batches([record_batch]).schema.names
+    parser = argparse.ArgumentParser(description="Count the data points of each column represented by each model type.")
+    parser.add_argument("dataset")
+    parser.add_argument("error_bound", type=float)
+    parser.add_argument("coefficient")
+    parser.add_argument(
+        "--client-side",
+        action="store_true",
+        help="count the sentinel values on the client instead of in one query, this is also done if the query fails",
+    )
+    arguments = parser.parse_args()
+
+    dataset=arguments.dataset
+    error=arguments.error_bound
+    coefficient=arguments.coefficient
+
+    flight_client = flight.FlightClient("grpc://127.0.0.1:9999")
+    schema = flight_results.read_table(flight_client, SELECT_ONE_QUERY.format(dataset)).schema
+
+    # Only field columns can contain sentinel values
+    column_names = []
+    for field in schema:
+        if field.name in ['timestamp', 'TimeStamp', 'time', 'date', 'datetime'] or not pyarrow.types.is_floating(field.type): continue
+        column_names.append(field.name)
+
+    if arguments.client_side:
+        counts = count_on_client(flight_client, dataset, column_names)
+    else:
+        try:
+            counts = count_on_server(flight_client, dataset, column_names)
+        except flight.FlightError as e:
+            print(f"Counting on the client as the query failed: {e}")
+            counts = count_on_client(flight_client, dataset, column_names)
+
     header = ['dataset','error_bound','coefficient','model_type', 'signal', 'value_cnt']
     rows = [header]
+    index = 0
     for column_name in column_names:
-        if column_name in ['timestamp', 'TimeStamp', 'time', 'date', 'datetime']: continue
-        for model_type, model_type_query in CNT_QUERIES.items():
-            if model_type == 'gorilla':
-                model_type_query = model_type_query.format(dataset, column_name, SWING_SENTINEL_VALUE, column_name, PMC_SENTINEL_VALUE)
-            else:
-                model_type_query = model_type_query.format(dataset, column_name)
-            ticket = flight.Ticket(model_type_query)
-            flight_stream_reader = flight_client.do_get(ticket)
-            try:
-                value = flight_stream_reader.read_pandas().iloc[0,0]
-            except Exception as e:
-                print("Received exception while reading data: " + e)
-                sys.exit(0)
-            
-            if value == None:
-                print("Received null for response")
-            rows.append([dataset, error, coefficient, model_type, column_name, value])
-    
+        for model_type in get_model_type_conditions(column_name):
+            rows.append([dataset, error, coefficient, model_type, column_name, counts[index]])
+            index += 1
+
     with open(f'model_distribution_result_{dataset}-{str(error)}-{coefficient}.csv', 'w', newline = '') as csvfile:
         writer = csv.writer(csvfile)
-        writer.writerows(rows)
\ No newline at end of file
+        writer.writerows(rows)
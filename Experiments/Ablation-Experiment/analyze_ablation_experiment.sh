@@ -8,6 +8,7 @@ ModelarDB_macaque_path="../../ModelarDB-versions/ModelarDB-Macaque/"
 
 storage_insights_analysis_script="../../Utilities/compute_storage_insights.py"
 ingestion_script="../../Utilities/ingest_parquet_to_modelardb.py"
+data_folder_size_script="../../Utilities/compute_data_folder_size.py"
 output_dir=$(pwd)
 
 table_name=$1
@@ -73,7 +74,7 @@ compress_error_bounds() {
             # write results of the python program logs to the common file
             sleep $sleep_for_vacuum
             echo "Compressed in $duration seconds" > $results_file
-            compression_size=$(du -h -d0 $ModelarDB_Data)
+            compression_size=$(python3 $data_folder_size_script $ModelarDB_Data)
             echo "Compression size: $compression_size" >> $results_file
             # run storage insights
             python3 $storage_insights_analysis_script "$ModelarDB_Data" "$table_name" "$coefficient-$error_bound-$table_name.db" 
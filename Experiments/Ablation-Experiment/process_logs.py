@@ -4,6 +4,10 @@ import os
 import glob
 import csv
 
+# The size of the data folder is written to the logs by compute_data_folder_size.py.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "Utilities"))
+from compute_data_folder_size import read_compression_size
+
 
 def get_log_files(path):
     if os.path.isdir(path):
@@ -35,16 +39,15 @@ def main(files):
         compressed_time_match = re.search(r'Compressed in (\d+(?:\.\d+)?) seconds', log)
         compressed_time = float(compressed_time_match.group(1)) if compressed_time_match else None
 
-        # Extract compression size (supporting decimal numbers)
-        compression_size_match = re.search(r'Compression size: (\d+(?:\.\d+)?[KMGTP]?)', log)
-        compression_size = compression_size_match.group(1) if compression_size_match else None
+        # Extract the exact compression size in bytes
+        compression_size = read_compression_size(log)
         
         rows.append([compression_name, number, dataset, compression_size, compressed_time])
     output_csv = "output.csv"
     # Write to CSV
     with open(output_csv, "w", newline="") as f:
         writer = csv.writer(f)
-        writer.writerow(["compression_name", "number", "dataset", 'compression_size', 'compressed_time'])
+        writer.writerow(["compression_name", "number", "dataset", 'compression_size_in_bytes', 'compressed_time'])
         writer.writerows(rows)
 
     print(f"Saved parsed results to {output_csv}")
@@ -8,6 +8,7 @@ ModelarDB_Data="/srv/data4/abduvoris/modelardb_data/"
 
 # TODO: confirm that path to ModelarDB Utilities is correct
 ingestion_script="../../Utilities/ingest_parquet_to_modelardb.py"
+data_folder_size_script="../../Utilities/compute_data_folder_size.py"
 output_dir=$(pwd)
 
 table_name=$1
@@ -65,7 +66,7 @@ compress_error_bounds() {
             # write results of the python program logs to the common file
             sleep $sleep_for_vacuum
             echo "Compressed in $duration seconds" > $results_file
-            compression_size=$(du -h -d0 $ModelarDB_Data)
+            compression_size=$(python3 $data_folder_size_script $ModelarDB_Data)
             echo "Compression size: $compression_size" >> $results_file
             # stop ModelarDB
             stop_modelardb
@@ -1,10 +1,16 @@
+import os
 import sys
+import argparse
 
 from pyarrow import parquet
 from pyarrow import flight
 import time
 import logging
 
+# The helpers for reading query results are shared with the other scripts.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "Utilities"))
+import flight_results
+
 SELECT_ONE_QUERY = "SELECT {} FROM {};"
 Gorilla_Extracted_Files = '/srv/data3/abduvoris/Paper-2-Datasets/gorilla_only_extracted/Parquet/'
 
@@ -23,10 +29,19 @@ def get_files(path):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print(f"Usage: {sys.argv[0]} dataset_name error_bound")
+    parser = argparse.ArgumentParser(description="Measure the time it takes to decompress all data points of a dataset.")
+    parser.add_argument("dataset_name")
+    parser.add_argument("error_bound")
+    parser.add_argument(
+        "--per-column",
+        action="store_true",
+        help="query each column concurrently instead of all columns in one query",
+    )
+    parser.add_argument("--workers", type=int, default=8, help="number of columns queried concurrently with --per-column")
+    arguments = parser.parse_args()
+
     logging.basicConfig(
-        filename=f"{sys.argv[1]}-{sys.argv[2]}.log",
+        filename=f"{arguments.dataset_name}-{arguments.error_bound}.log",
         encoding="utf-8",
         filemode="a",
         level=logging.INFO,
@@ -34,17 +49,18 @@ if __name__ == "__main__":
         )
     
     tick = time.perf_counter()
-    dataset_name=sys.argv[1]
-    # iterate over columns of it
+    dataset_name=arguments.dataset_name
     flight_client = flight.FlightClient("grpc://127.0.0.1:9999")
-    ticket = flight.Ticket(f"SELECT * FROM {dataset_name}")
-    flight_stream_reader = flight_client.do_get(ticket)
     # We read batches to ensure all data is retrieved
-    for flight_stream_chunk in flight_stream_reader:
-        _ = flight_stream_chunk.data
+    if arguments.per_column:
+        column_names = flight_results.read_table(flight_client, f"SELECT * FROM {dataset_name} LIMIT 1").schema.names
+        queries = [SELECT_ONE_QUERY.format(column_name, dataset_name) for column_name in column_names]
+        for _ in flight_results.execute_queries(flight_client, queries, flight_results.read_row_count, arguments.workers):
+            pass
+    else:
+        flight_results.read_row_count(flight_client, f"SELECT * FROM {dataset_name}")
     flight_client.close()
     tock = time.perf_counter()
     print(f"Decompression time: {tock - tick:.4f} s")
     logging.info(f"Decompression time: {tock - tick:.4f} s")
     time.sleep(5)
-    
\ No newline at end of file
@@ -4,6 +4,10 @@ import os
 import glob
 import csv
 
+# The size of the data folder is written to the logs by compute_data_folder_size.py.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "Utilities"))
+from compute_data_folder_size import read_compression_size
+
 
 def get_log_files(path):
     if os.path.isdir(path):
@@ -26,7 +30,7 @@ def match_system_name(name):
     
 
 def main(files, dataset_name):
-    output = [['error_bound', 'system_name', 'compressed_time_in_seconds', 'compression_size', 'decompression_time_in_seconds']]
+    output = [['error_bound', 'system_name', 'compressed_time_in_seconds', 'compression_size_in_bytes', 'decompression_time_in_seconds']]
     for file in files:  
         # Open and read the log file
         with open(file, "r") as f:
@@ -36,9 +40,8 @@ def main(files, dataset_name):
         compressed_time_match = re.search(r'Compressed in (\d+(?:\.\d+)?) seconds', log)
         compressed_time = float(compressed_time_match.group(1)) if compressed_time_match else None
 
-        # Extract compression size (supporting decimal numbers)
-        compression_size_match = re.search(r'Compression size: (\d+(?:\.\d+)?[KMGTP]?)', log)
-        compression_size = compression_size_match.group(1) if compression_size_match else None
+        # Extract the exact compression size in bytes
+        compression_size = read_compression_size(log)
 
         # Extract decompression time
         decompression_time_match = re.search(r'Decompression time: (\d+(?:\.\d+)?) s', log)
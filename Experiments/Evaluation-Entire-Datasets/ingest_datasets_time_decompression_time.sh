@@ -17,6 +17,7 @@ modelardb_macaque_path=../../ModelarDB-versions/ModelarDB-Macaque
 
 decompression_test_script="decompression_test.py"
 parquet_ingestor="../../Utilities/ingest_parquet_to_modelardb.py"
+data_folder_size_script="../../Utilities/compute_data_folder_size.py"
 
 output_dir=$(pwd)
 
@@ -62,7 +63,7 @@ main() {
                 # write results of the python program logs to the common file
                 sleep $sleep_for_vacuum
                 echo "Compressed in $duration seconds" > $results_file
-                compression_size=$(du -h -d0 $ModelarDB_Data)
+                compression_size=$(python3 $data_folder_size_script $ModelarDB_Data)
                 echo "Compression size: $compression_size" >> $results_file
                 python3 $decompression_test_script $table_name $error_bound >> $results_file
                 # stop ModelarDB
@@ -1,59 +1,113 @@
+import os
 import sys
+import argparse
 import numpy as np
 
-from pyarrow import parquet
 import pyarrow
+from pyarrow import parquet
 from pyarrow import flight
+import pyarrow.compute as pc
+
+# The helpers for reading query results are shared with the other scripts.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "Utilities"))
+import flight_results
 
 PMC_SENTINEL_VALUE = np.inf
 SWING_SENTINEL_VALUE = -np.inf
 TURBINE_ID = 2310183 
+TIMESTAMP_COLUMNS = ['ts', 'datetime', 'Time', 'date', 'TimeStamp', 'timestamp']
+# Only the timestamps of the values that are not sentinels are returned by ModelarDB
+GORILLA_TIMESTAMPS_QUERY = "SELECT {} FROM {} WHERE {} <> arrow_cast('inf', 'Float32') AND {} <> arrow_cast('-inf', 'Float32')"
 
 def get_safe_col_name(col_name):
     return col_name.lower().replace(" ", "_")
 
 
+def get_field_columns(original_df):
+    return [col for col in original_df.column_names if col not in TIMESTAMP_COLUMNS + ['Turbine']]
+
+
+def write_gorilla_values(original_df, col, gorilla_indices, error, save_path):
+    # check if dataset is not empty
+    if len(gorilla_indices) > 10000:
+        print(col)
+        parquet.write_table(
+            original_df.select([col]).take(gorilla_indices),
+            save_path+f'/{error}-{col}.parquet', 
+            compression="snappy"
+            )
+
+
+def filter_on_client(flight_client, original_df, dataset, error, save_path):
+    output_table = flight_results.read_table(flight_client, f"SELECT * FROM {dataset}")
+    if output_table.num_rows > 0:
+        # We only keep one turbine ID for turbinelog, the mask is computed once for all columns
+        keep_mask = None
+        if dataset == 'turbinelog':
+            turbine_column = output_table.column(get_safe_col_name('Turbine'))
+            keep_mask = pc.fill_null(pc.equal(turbine_column, str(TURBINE_ID)), False)
+
+        for col in get_field_columns(original_df):
+            values = output_table.column(get_safe_col_name(col))
+
+            # Values that are not sentinels written by PMC and Swing are Gorilla values
+            sentinel_values = pyarrow.array([PMC_SENTINEL_VALUE, SWING_SENTINEL_VALUE], type=values.type)
+            gorilla_mask = pc.invert(pc.is_in(values, value_set=sentinel_values))
+            if keep_mask is not None:
+                gorilla_mask = pc.and_(gorilla_mask, keep_mask)
+            write_gorilla_values(original_df, col, pc.indices_nonzero(gorilla_mask), error, save_path)
+
+
+def filter_on_server(flight_client, original_df, dataset, error, save_path, workers):
+    # ModelarDB only returns the timestamps of the Gorilla values for each column, so the
+    # original rows are found by their timestamps instead of their position in SELECT *
+    ts_col = next(col for col in original_df.column_names if col in TIMESTAMP_COLUMNS)
+    original_timestamps = original_df.column(ts_col)
+
+    keep_mask = None
+    where_turbine = ""
+    if dataset == 'turbinelog':
+        turbine_column = pc.cast(original_df.column('Turbine'), pyarrow.string())
+        keep_mask = pc.fill_null(pc.equal(turbine_column, str(TURBINE_ID)), False)
+        where_turbine = f" AND {get_safe_col_name('Turbine')} = '{TURBINE_ID}'"
+
+    field_columns = get_field_columns(original_df)
+    queries = []
+    for col in field_columns:
+        safe_name = get_safe_col_name(col)
+        query = GORILLA_TIMESTAMPS_QUERY.format(get_safe_col_name(ts_col), dataset, safe_name, safe_name)
+        queries.append(query + where_turbine)
+
+    # The queries are executed concurrently as each only transfers the Gorilla values of one column
+    gorilla_tables = flight_results.execute_queries(flight_client, queries, max_in_flight_streams=workers)
+    for col, gorilla_table in zip(field_columns, gorilla_tables):
+        gorilla_timestamps = gorilla_table.column(0).cast(original_timestamps.type)
+        gorilla_mask = pc.is_in(original_timestamps, value_set=gorilla_timestamps)
+        if keep_mask is not None:
+            gorilla_mask = pc.and_(gorilla_mask, keep_mask)
+        write_gorilla_values(original_df, col, pc.indices_nonzero(gorilla_mask), error, save_path)
+
+
 if __name__ == "__main__":
-    if len(sys.argv) != 5:
-        print(f"Usage: {sys.argv[0]} original_dataset_path dataset eb save_path")
-        sys.exit(0)
-        
-    original_dataset_path=sys.argv[1]
-    dataset=sys.argv[2]
-    error=float(sys.argv[3])
-    save_path=sys.argv[4]
-    
-    original_df = parquet.read_table(original_dataset_path)
+    parser = argparse.ArgumentParser(description="Extract the values of the original dataset that ModelarDB compressed with Gorilla.")
+    parser.add_argument("original_dataset_path")
+    parser.add_argument("dataset")
+    parser.add_argument("eb", type=float)
+    parser.add_argument("save_path")
+    parser.add_argument(
+        "--pushdown",
+        action="store_true",
+        help="filter out sentinels in ModelarDB with one concurrent query per column instead of on the client",
+    )
+    parser.add_argument("--workers", type=int, default=8, help="number of concurrent queries with --pushdown")
+    arguments = parser.parse_args()
+
+    original_df = parquet.read_table(arguments.original_dataset_path)
     
     flight_client = flight.FlightClient("grpc://127.0.0.1:9999")
-    ticket = flight.Ticket(f"SELECT * FROM {dataset}")
-    flight_stream_reader = flight_client.do_get(ticket)
-
-    output_table = None
-    for flight_stream_chunk in flight_stream_reader:
-        record_batch = flight_stream_chunk.data
-        if output_table is None:
-            output_table = pyarrow.Table.from_batches([record_batch])
-        else:
-            output_table = pyarrow.concat_tables([output_table, pyarrow.Table.from_batches([record_batch])])
-    if output_table is not None and output_table.shape[0] > 0:
-        #TODO: rewrite this logic with only pyarrow
-        # output_df = output_df.to_pandas().reset_index(drop=True)
-        # output_df = output_df.reset_index(drop=True)
-        for col in original_df.column_names:
-            if col in ['ts', 'datetime', 'Time', 'date', 'TimeStamp', 'timestamp', 'Turbine']:
-                continue
-            safe_name = get_safe_col_name(col)
-            tempdf = output_table.to_pandas().reset_index(drop=True)
-            # We only keep one turbine ID for turbinelog
-            if dataset == 'turbinelog':
-                tempdf = tempdf.loc[tempdf[get_safe_col_name('Turbine')] == str(TURBINE_ID)]
-            tempdf = tempdf.loc[~tempdf[safe_name].isin([PMC_SENTINEL_VALUE, SWING_SENTINEL_VALUE]), safe_name]
-            # check if dataset is not empty
-            if tempdf.shape[0] > 10000:
-                print(col)
-                parquet.write_table(
-                    original_df.take(tempdf.index.tolist()).flatten().select([col]), 
-                    save_path+f'/{error}-{col}.parquet', 
-                    compression="snappy"
-                    )
+    if arguments.pushdown:
+        filter_on_server(
+            flight_client, original_df, arguments.dataset, arguments.eb, arguments.save_path, arguments.workers
+        )
+    else:
+        filter_on_client(flight_client, original_df, arguments.dataset, arguments.eb, arguments.save_path)
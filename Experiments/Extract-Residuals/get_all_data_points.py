@@ -1,9 +1,12 @@
+import os
 import sys
 
-from pyarrow import parquet
-import pyarrow
 from pyarrow import flight
 
+# The helpers for reading query results are shared with the other scripts.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "Utilities"))
+import flight_results
+
 PMC_SENTINEL_VALUE = -888.0
 SWING_SENTINEL_VALUE = -999.0
 
@@ -21,31 +24,29 @@ if __name__ == "__main__":
     save_path=sys.argv[3]
     
     flight_client = flight.FlightClient("grpc://127.0.0.1:9999")
-    ticket = flight.Ticket(f"SELECT * FROM {dataset_name}")
-    flight_stream_reader = flight_client.do_get(ticket)
-
-    output_table = None
-    for flight_stream_chunk in flight_stream_reader:
-        record_batch = flight_stream_chunk.data
-        if output_table is None:
-            output_table = pyarrow.Table.from_batches([record_batch])
-        else:
-            output_table = pyarrow.concat_tables([output_table, pyarrow.Table.from_batches([record_batch])])
-    if output_table is not None and output_table.num_rows > 0:
-        #TODO: rewrite this logic with only pyarrow
-        # output_df = output_df.to_pandas().reset_index(drop=True)
-        # output_df = output_df.reset_index(drop=True)
-        ts_col = None
-        for col in output_table.column_names:
-            if col.lower() in ['ts', 'datetime', 'time', 'date', 'timestamp']:
-                ts_col = col
-                continue
-            temp_table = output_table.select([ts_col, col])
-            # check if dataset is not empty
-            if temp_table.num_rows > 10000:
-                print(col)
-                parquet.write_table(
-                    temp_table,
-                    save_path+f'/{error_bound}-{col}.parquet', 
-                    compression="snappy"
-                    )
\ No newline at end of file
+    flight_stream_reader = flight_results.do_get(flight_client, f"SELECT * FROM {dataset_name}")
+
+    # Each column is written with the timestamps to its own file as the
+    # batches arrive, so the result is never kept in memory at once.
+    schema = flight_stream_reader.schema
+    ts_col = None
+    output_columns = {}
+    output_paths_to_col = {}
+    for col in schema.names:
+        if col.lower() in ['ts', 'datetime', 'time', 'date', 'timestamp']:
+            ts_col = col
+            continue
+        output_path = save_path + f'/{error_bound}-{col}.parquet'
+        output_columns[output_path] = [ts_col, col]
+        output_paths_to_col[output_path] = col
+
+    # Only files for columns that are not almost empty are kept.
+    row_counts = flight_results.write_record_batches_per_column(
+        flight_results.read_record_batches(flight_stream_reader),
+        schema,
+        output_columns,
+        compression="snappy",
+        min_row_count=10000,
+    )
+    for output_path in row_counts:
+        print(output_paths_to_col[output_path])
@@ -20,6 +20,7 @@ modelardb_gorillav_path=../../ModelarDB-versions/ModelarDB-GorillaV
 
 decompression_test_script="../Evaluation-Entire-Datasets/decompression_test.py"
 parquet_ingestor="../../Utilities/ingest_parquet_to_modelardb.py"
+data_folder_size_script="../../Utilities/compute_data_folder_size.py"
 processing_script="$HOME/PlatypusMacaque/Experiments/Extract-Residuals/filter_out_gorilla_indexes.py"
 
 
@@ -67,7 +68,7 @@ main() {
                 # write results of the python program logs to the common file
                 sleep $sleep_for_vacuum
                 echo "Compressed in $duration seconds" > $results_file
-                compression_size=$(du -h -d0 $ModelarDB_Data)
+                compression_size=$(python3 $data_folder_size_script $ModelarDB_Data)
                 echo "Compression size: $compression_size" >> $results_file
                 # stop ModelarDB
                 stop_modelardb
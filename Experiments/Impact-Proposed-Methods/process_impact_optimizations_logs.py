@@ -4,6 +4,10 @@ import os
 import glob
 import csv
 
+# The size of the data folder is written to the logs by compute_data_folder_size.py.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "Utilities"))
+from compute_data_folder_size import read_compression_size
+
 
 def get_log_files(path):
     if os.path.isdir(path):
@@ -31,7 +35,7 @@ def get_dataset_name(name):
     return name
 
 def main(files,):
-    output = [['dataset_name', 'error_bound', 'system_name', 'compressed_time_in_seconds', 'compression_size',]]
+    output = [['dataset_name', 'error_bound', 'system_name', 'compressed_time_in_seconds', 'compression_size_in_bytes',]]
     for file in files:  
         # Open and read the log file
         with open(file, "r") as f:
@@ -39,12 +43,10 @@ def main(files,):
             
         # Regex patterns
         time_match = re.search(r'Compressed in (\d+)\s+seconds', log)
-        size_match = re.search(r'Compression size:\s+([\d.]+[KMG]?)\s+(.+)', log)
+        compression_size = read_compression_size(log)
 
-        if time_match and size_match:
+        if time_match and compression_size is not None:
             compression_time = int(time_match.group(1))
-            compression_size = size_match.group(1)
-            output_path = size_match.group(2).strip()
         else:
             raise ValueError("Log file doesn't match expected format.")
         # # Extract compressed time
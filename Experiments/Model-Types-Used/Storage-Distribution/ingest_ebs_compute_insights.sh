@@ -9,6 +9,7 @@ data_file_or_files_path=$2
 # Path to Utilities
 analysis_script="../../Utilities/compute_storage_insights.py"
 ingestion_script="../../Utilities/ingest_parquet_to_modelardb.py"
+data_folder_size_script="../../Utilities/compute_data_folder_size.py"
 
 error_bounds="0 0.01 0.1 1 5 10"
 port="127.0.0.1:9999"
@@ -81,7 +82,7 @@ main() {
         # write results of the python program logs to the common file
         sleep $sleep_for_vacuum
         echo "Compressed in $duration seconds" > $results_file
-        compression_size=$(du -h -d0 $ModelarDB_Data)
+        compression_size=$(python3 $data_folder_size_script $ModelarDB_Data)
         echo "Compression size: $compression_size" >> $results_file
         python3 $analysis_script "$ModelarDB_Data" "$table_name" "$table_name-$error_bound-$system_name.db"
         # stop ModelarDB
@@ -1,10 +1,15 @@
+import os
 import sys
+import argparse
 
 from pyarrow import parquet
-import pyarrow
 from pyarrow import flight
 import time
 
+# The helpers for reading query results are shared with the other scripts.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir, "Utilities"))
+import flight_results
+
 SELECT_ONE_QUERY = "SELECT {} FROM {};"
 Gorilla_Extracted_Files = '/srv/data3/abduvoris/Paper-2-Datasets/gorilla_only_extracted/Parquet/'
 
@@ -23,15 +28,19 @@ def get_files(path):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 5:
-        print(f"Usage: {sys.argv[0]} dataset_name original_dataset_file eb save_path")
-        sys.exit(0)
+    parser = argparse.ArgumentParser(description="Query all data points of each column compressed by Gorilla.")
+    parser.add_argument("dataset_name")
+    parser.add_argument("original_dataset_file")
+    parser.add_argument("eb")
+    parser.add_argument("save_path")
+    parser.add_argument("--workers", type=int, default=8, help="number of columns queried concurrently")
+    arguments = parser.parse_args()
 
-    dataset_name=sys.argv[1]
-    original_data_path=sys.argv[2]
+    dataset_name=arguments.dataset_name
+    original_data_path=arguments.original_dataset_file
 
-    error_bound=sys.argv[3]
-    save_path=sys.argv[4]
+    error_bound=arguments.eb
+    save_path=arguments.save_path
     
     
     # Read schema of the original dataset
@@ -47,15 +56,14 @@ if __name__ == "__main__":
     column_names = [col_name.split('-')[-1].replace('.parquet','') for col_name in column_names]
     # iterate over columns of it
     flight_client = flight.FlightClient("grpc://127.0.0.1:9999")
+    queries = []
     for column_name in column_names:
         if column_name.lower() in ['turbine', 'timestamp', 'datetime']: continue
-        ticket = flight.Ticket(f"SELECT {get_safe_col_name(column_name)} FROM {dataset_name}")
-        flight_stream_reader = flight_client.do_get(ticket)
-        # We read batches to ensure all data is retrieved
-        for flight_stream_chunk in flight_stream_reader:
-            _ = flight_stream_chunk.data
-        time.sleep(10)
-        # now preprocess segments table
+        queries.append(f"SELECT {get_safe_col_name(column_name)} FROM {dataset_name}")
+
+    # The columns are queried concurrently and all batches are read to ensure all data is retrieved
+    for _ in flight_results.execute_queries(flight_client, queries, flight_results.read_row_count, arguments.workers):
+        pass
     time.sleep(3)
     flight_client.close()
     time.sleep(5)
@@ -11,6 +11,7 @@ ModelarDB_Data="data/"
 # TODO: confirm that path to ModelarDB Utilities is correct
 ingestion_script="~/Utilities/Apache-Parquet-Loader/main.py"
 analysis_script="~/Utilities/ModelarDB-Storage-Insights/main.py"
+data_folder_size_script="../Utilities/compute_data_folder_size.py"
 output_dir=$(pwd)
 
 table_name=$1
@@ -64,7 +65,7 @@ compress_error_bounds() {
         # write results of the python program logs to the common file
         sleep $sleep_for_vacuum
         echo "Compressed in $duration seconds" > $results_file
-        compression_size=$(du -h -d0 $ModelarDB_Data)
+        compression_size=$(python3 $data_folder_size_script $ModelarDB_Data)
         echo "Compression size: $compression_size" >> $results_file
         python3 $analysis_script $ModelarDB_Data $table_name >> $results_file
         # stop ModelarDB
@@ -0,0 +1,127 @@
+"""Compute the exact number of bytes used by a ModelarDB data folder, split into
+tables and metadata, per model table, and per field column partition, and print
+it as JSON on one line so it can be written to the experiment logs. The sizes
+are the sum of the size of the files, unlike du which rounds and counts blocks.
+"""
+import os
+import re
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+
+# The format written by du -h before this script replaced it, e.g., 558M.
+DU_SIZE_PATTERN = re.compile(r"Compression size:\s+(?P<size>\d+(?:\.\d+)?)(?P<unit>[KMGTP]?)\s")
+JSON_SIZE_PATTERN = re.compile(r"Compression size:\s+(?P<json>\{.*\})")
+DU_UNITS = ["", "K", "M", "G", "T", "P"]
+
+
+def compute_data_folder_size(data_folder: str, workers: int) -> dict:
+    data_folder = os.path.expanduser(data_folder)
+    size = {
+        "data_folder": os.path.abspath(data_folder),
+        "size_in_bytes": 0,
+        "tables": {"size_in_bytes": 0, "model_tables": {}},
+        "metadata": {"size_in_bytes": 0, "folders": {}},
+        "other": {"size_in_bytes": 0, "folders": {}},
+    }
+
+    # The folders that are summed in parallel are found while the files above
+    # them are summed, each is stored with the dict to store its size in.
+    folders_to_sum = []
+    size_in_bytes, folders = scan_folder(data_folder)
+    size["other"]["size_in_bytes"] += size_in_bytes
+    for folder in folders:
+        if folder.name == "tables":
+            size_in_bytes, model_table_folders = scan_folder(folder.path)
+            size["tables"]["size_in_bytes"] += size_in_bytes
+
+            for model_table_folder in model_table_folders:
+                size_in_bytes, field_column_folders = scan_folder(model_table_folder.path)
+                model_table = {"size_in_bytes": size_in_bytes, "field_columns": {}}
+                size["tables"]["model_tables"][model_table_folder.name] = model_table
+                for field_column_folder in field_column_folders:
+                    folders_to_sum.append((model_table["field_columns"], field_column_folder))
+        elif folder.name == "metadata":
+            size_in_bytes, metadata_folders = scan_folder(folder.path)
+            size["metadata"]["size_in_bytes"] += size_in_bytes
+            for metadata_folder in metadata_folders:
+                folders_to_sum.append((size["metadata"]["folders"], metadata_folder))
+        else:
+            folders_to_sum.append((size["other"]["folders"], folder))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        sizes_in_bytes = executor.map(lambda folder_to_sum: sum_folder(folder_to_sum[1].path), folders_to_sum)
+        for (sizes, folder), size_in_bytes in zip(folders_to_sum, sizes_in_bytes):
+            sizes[folder.name] = size_in_bytes
+
+    # The size of each folder includes the size of the folders in it.
+    for model_table in size["tables"]["model_tables"].values():
+        model_table["size_in_bytes"] += sum(model_table["field_columns"].values())
+        size["tables"]["size_in_bytes"] += model_table["size_in_bytes"]
+    for part in ["metadata", "other"]:
+        size[part]["size_in_bytes"] += sum(size[part]["folders"].values())
+    size["size_in_bytes"] = sum(size[part]["size_in_bytes"] for part in ["tables", "metadata", "other"])
+    return size
+
+
+def scan_folder(path: str) -> tuple[int, list[os.DirEntry]]:
+    # Return the size of the files directly in the folder and the folders in it.
+    size_in_bytes = 0
+    folders = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                folders.append(entry)
+            elif entry.is_file(follow_symlinks=False):
+                size_in_bytes += entry.stat(follow_symlinks=False).st_size
+    return size_in_bytes, sorted(folders, key=lambda folder: folder.name)
+
+
+def sum_folder(path: str) -> int:
+    # The folders are visited iteratively so deep folders cannot exceed the recursion limit.
+    size_in_bytes = 0
+    folders = [path]
+    while folders:
+        folder_size_in_bytes, sub_folders = scan_folder(folders.pop())
+        size_in_bytes += folder_size_in_bytes
+        folders.extend(sub_folder.path for sub_folder in sub_folders)
+    return size_in_bytes
+
+
+def read_compression_size(log: str) -> int:
+    # Return the size in bytes written to a log by this script. Logs written
+    # with du -h before are also supported, but their sizes are rounded.
+    json_match = JSON_SIZE_PATTERN.search(log)
+    if json_match:
+        return json.loads(json_match.group("json"))["size_in_bytes"]
+
+    du_match = DU_SIZE_PATTERN.search(log)
+    if du_match:
+        return round(float(du_match.group("size")) * 1024 ** DU_UNITS.index(du_match.group("unit")))
+    return None
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Compute the exact number of bytes used by a ModelarDB data folder and print it as JSON."
+    )
+    parser.add_argument("data_folder", help="folder ModelarDB stores its data in")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="number of threads summing the size of folders in parallel (default: 8)",
+    )
+    parser.add_argument("--indent", type=int, help="indent the JSON for reading instead of printing one line")
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+    size = compute_data_folder_size(arguments.data_folder, arguments.workers)
+    print(json.dumps(size, indent=arguments.indent))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,19 @@ This script uses and changes the open source [script](https://github.com/Modelar
 Authors: Søren Kejser Jensen and Christian Schmidt Godiksen.
 """
 import os
-import sys
+import json
+import time
 import sqlite3
+import argparse
 import tempfile
-from dataclasses import dataclass
-from collections import Counter
+import functools
+from typing import Iterator
+from dataclasses import dataclass, asdict, replace
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import pyarrow
+from pyarrow import csv
 from pyarrow import parquet
 from pyarrow import Table
 import pyarrow.compute as pc
@@ -18,6 +24,36 @@ import pyarrow.compute as pc
 # Must match IDs used by modelardb_compression.
 MODEL_TYPE_ID_TO_NAME = ["PMC_Mean", "Swing", "Gorilla"]
 
+# The grid of codecs, levels, and page sizes evaluated for each column when
+# sweeping, the encodings depend on the type of the column being encoded.
+SWEEP_COMPRESSIONS = [
+    ("NONE", None),
+    ("SNAPPY", None),
+    ("LZ4", None),
+    ("GZIP", None),
+    ("BROTLI", None),
+    ("ZSTD", 1),
+    ("ZSTD", 3),
+    ("ZSTD", 9),
+    ("ZSTD", 19),
+]
+SWEEP_DATA_PAGE_SIZES = [4096, 16384, 65536, 1048576]
+
+# The results exported for further analysis, each is aggregated per field column.
+EXPORT_QUERIES = {
+    "file": """SELECT field_column, COUNT(*) AS file_count, SUM(rust_size_in_bytes) AS rust_size_in_bytes, SUM(python_size_in_bytes) AS python_size_in_bytes, SUM(data_point_count) AS data_point_count
+                FROM file GROUP BY field_column ORDER BY field_column""",
+    "model_type_use": """SELECT field_column, model_type_id, SUM(segment_count) AS segment_count, SUM(python_size_in_bytes) AS python_size_in_bytes
+                          FROM model_type_use GROUP BY field_column, model_type_id ORDER BY field_column, model_type_id""",
+    "file_column": """SELECT field_column, column_index, column_name, SUM(python_size_in_bytes) AS python_size_in_bytes
+                       FROM file_column GROUP BY field_column, column_index ORDER BY field_column, column_index""",
+    "column_chunk": """SELECT field_column, column_index, column_name, SUM(compressed_size_in_bytes) AS compressed_size_in_bytes, SUM(uncompressed_size_in_bytes) AS uncompressed_size_in_bytes
+                        FROM column_chunk GROUP BY field_column, column_index ORDER BY field_column, column_index""",
+    "encoding_use": """SELECT field_column, model_type_id, column_name, compression, compression_level, column_encoding, use_dictionary, data_page_size, SUM(python_size_in_bytes) AS python_size_in_bytes
+                        FROM encoding_use GROUP BY field_column, model_type_id, column_name, compression, compression_level, column_encoding, use_dictionary, data_page_size
+                        ORDER BY field_column, model_type_id, column_name""",
+}
+
 
 @dataclass
 class Configuration:
@@ -27,116 +63,445 @@ class Configuration:
     row_group_size: int = 65536
     column_encoding: str = "PLAIN"
     compression: str = "ZSTD"
+    compression_level: int = None
     use_dictionary: bool = False
     write_statistics: bool = False
+    measure_on_disk: bool = False
+    metadata_only: bool = False
+    sweep_encodings: bool = False
+    sampling_interval_in_us: int = None
 
     def model_table_path(self) -> str:
         return self.data_folder + os.sep + "tables" + os.sep + self.model_table_name
 
 
-def list_and_process_files(configuration: Configuration, results: sqlite3.Connection):
-    result_id = 1
+@dataclass
+class FileMeasurement:
+    # Rows for the file, model_type_use, file_column, column_chunk, and
+    # encoding_use tables in the results. Only files estimated from their
+    # metadata have column chunks and only swept files have encoding uses.
+    file: tuple
+    model_type_use: list[tuple]
+    file_column: list[tuple]
+    column_chunk: list[tuple]
+    encoding_use: list[tuple]
+
+
+def list_and_process_files(configuration: Configuration, results: sqlite3.Connection, jobs: int = 1):
+    file_paths = list_files(configuration)
+    file_identities = {file_path: identify_file(configuration, file_path) for file_path in file_paths}
+    evicted_file_paths = evict_changed_files(file_identities, results)
+
+    # Files that are unchanged since they were measured with the same configuration are skipped.
+    measured_file_paths = set(execute_and_return_list("SELECT file_path FROM measured_file", results))
+    file_paths = [file_path for file_path in file_paths if file_path not in measured_file_paths]
+    print(
+        f"Measuring {len(file_paths)} files, skipping {len(measured_file_paths)} unchanged files, "
+        f"evicted {len(evicted_file_paths)} changed or removed files"
+    )
+    print()
+
+    if configuration.metadata_only:
+        measure = functools.partial(estimate_file_and_its_columns, configuration)
+    elif configuration.sweep_encodings:
+        measure = functools.partial(measure_and_sweep_file_and_its_columns, configuration)
+    else:
+        measure = functools.partial(measure_file_and_its_columns, configuration)
+
+    if jobs > 1 and configuration.sweep_encodings and not configuration.metadata_only:
+        # Each file is read once and its columns are encoded with each configuration
+        # in the grid by threads, as Apache Arrow releases the GIL while encoding.
+        with ThreadPoolExecutor(max_workers=jobs) as executor, results:
+            for file_path in file_paths:
+                measurement = measure_and_sweep_file_and_its_columns(configuration, file_path, executor)
+                insert_measurement(file_identities[file_path], measurement, results)
+    elif jobs > 1:
+        # Files are measured by the workers while the results are only written
+        # by this process, map() returns them in order so the output is the same.
+        # All of the measurements are inserted in one transaction.
+        with ProcessPoolExecutor(max_workers=jobs) as executor, results:
+            for file_path, measurement in zip(file_paths, executor.map(measure, file_paths)):
+                insert_measurement(file_identities[file_path], measurement, results)
+    else:
+        with results:
+            for file_path in file_paths:
+                insert_measurement(file_identities[file_path], measure(file_path), results)
+
+
+def watch_files(configuration: Configuration, results: sqlite3.Connection, interval_in_seconds: float):
+    # ModelarDB writes the footer last, so files that are being written cannot
+    # be read and are measured at a later poll. Files that are removed, e.g., by
+    # compaction, are evicted so the series only includes the current files.
+    print(
+        f"{'Seconds':>8} {'Files':>8} {'Compressed MiB':>16} {'Segments':>12} {'Data Points':>14} {'Bytes/Data Point':>18}"
+    )
+    start_time = time.time()
+    try:
+        while True:
+            # Files removed after they are listed are skipped, and evicted if they were measured.
+            file_paths = list_files(configuration)
+            measured_file_identities = {}
+            for file_path in execute_and_return_list("SELECT file_path FROM measured_file", results):
+                if file_path in file_paths:
+                    try:
+                        measured_file_identities[file_path] = identify_file(configuration, file_path)
+                    except FileNotFoundError:
+                        continue
+            changed = len(evict_changed_files(measured_file_identities, results)) > 0
+
+            with results:
+                for file_path in file_paths:
+                    if file_path in measured_file_identities:
+                        continue
+
+                    try:
+                        file_identity = identify_file(configuration, file_path)
+                        measurement = estimate_file_and_its_columns(configuration, file_path)
+                    except (OSError, pyarrow.ArrowInvalid):
+                        continue
+                    insert_measurement(file_identity, measurement, results)
+                    changed = True
+
+            if changed:
+                print_watch_row(time.time() - start_time, results)
+            time.sleep(interval_in_seconds)
+    except KeyboardInterrupt:
+        print()
+
+
+def print_watch_row(elapsed_in_seconds: float, results: sqlite3.Connection):
+    file_count, python_size_in_bytes, data_point_count = results.execute(
+        "SELECT COUNT(*), SUM(python_size_in_bytes), SUM(data_point_count) FROM file"
+    ).fetchone()
+    segment_count = execute_and_return_value("SELECT SUM(segment_count) FROM model_type_use", results)
+
+    python_size_in_bytes = python_size_in_bytes or 0
+    if data_point_count:
+        bytes_per_data_point = f"{python_size_in_bytes / data_point_count:.4f}"
+    else:
+        data_point_count, bytes_per_data_point = "-", "-"
+    print(
+        f"{elapsed_in_seconds:>8.0f} {file_count:>8} {bytes_to_mib(python_size_in_bytes):>16} {segment_count or 0:>12} "
+        f"{data_point_count:>14} {bytes_per_data_point:>18}",
+        flush=True,
+    )
+
+
+def identify_file(configuration: Configuration, file_path: str) -> tuple:
+    # A file must be measured again if it or the configuration has changed.
+    stat_result = os.stat(file_path)
+    configuration_json = json.dumps(asdict(configuration), sort_keys=True)
+    return (file_path, stat_result.st_size, stat_result.st_mtime_ns, configuration_json)
+
+
+def evict_changed_files(file_identities: dict[str, tuple], results: sqlite3.Connection) -> list[str]:
+    measured_files = results.execute(
+        "SELECT file_path, size_in_bytes, modified_time_in_ns, configuration FROM measured_file"
+    ).fetchall()
+
+    evicted_file_paths = [
+        (measured_file[0],) for measured_file in measured_files if file_identities.get(measured_file[0]) != measured_file
+    ]
+    for table_name in ["file", "model_type_use", "file_column", "column_chunk", "encoding_use", "measured_file"]:
+        _ = results.executemany(f"DELETE FROM {table_name} WHERE file_path = ?", evicted_file_paths)
+    results.commit()
+    return evicted_file_paths
+
+
+def list_files(configuration: Configuration) -> list[str]:
+    file_paths = []
     top = configuration.model_table_path()
     for dirpath, _dirnames, filenames in os.walk(top):
         for filename in filenames:
             if not filename.endswith(".parquet"):
                 continue
 
-            file_path = os.path.join(dirpath, filename)
-            measure_file_and_its_columns(configuration, file_path, result_id, results)
-            result_id += 1
+            file_paths.append(os.path.join(dirpath, filename))
+    return file_paths
 
 
-def compute_model_size_with_python_size_in_bytes(configuration: Configuration, table: Table):
+def compute_model_types_used_and_size_in_bytes(
+    configuration: Configuration, table: Table, residuals_size_in_bytes: int
+) -> dict[int, tuple[int, int]]:
+    # Return the number of segments and their size in bytes for each model type.
     result = dict()
-    model_types =  table.column('model_type_id').to_pandas().unique()
-    for model_type in model_types:
+    for model_type, segment_count, model_type_table in split_by_model_type(table):
+        size_in_bytes = write_table(configuration, model_type_table.select(["min_value", "max_value", "values"]))
         if model_type == 2:
             # We need compute the size for Gorilla by also including all residuals from other models
-            value_size = write_table(
-                configuration, 
-                table.filter(pc.field('model_type_id') == model_type).select(['min_value', 'max_value', 'values'])
-                )
-            residuals_size = write_table(
-                configuration, 
-                table.select(['residuals'])
-                )
-            result[model_type] = residuals_size + value_size
-        else:
-            result[model_type] = write_table(
-                configuration, 
-                table.filter(pc.field('model_type_id') == model_type).select(['min_value', 'max_value', 'values'])
-                )
+            size_in_bytes += residuals_size_in_bytes
+
+        result[model_type] = (segment_count, size_in_bytes)
     return result
 
 
-def measure_file_and_its_columns(
-    configuration: Configuration, file_path: str, result_id, results: sqlite3.Connection
-):
-    table = parquet.read_table(file_path)
+def split_by_model_type(table: Table) -> Iterator[tuple[int, int, Table]]:
+    # Yield the id, number of segments, and segments of each model type. The
+    # segments are counted once with value_counts and then filtered instead of
+    # sorted and sliced, as a filter keeps the chunks of the table and thus the
+    # page boundaries and sizes of the encoded segments.
+    model_type_counts = pc.value_counts(table.column("model_type_id"))
+    for model_type_count in model_type_counts:
+        model_type = model_type_count["values"].as_py()
+        segment_count = model_type_count["counts"].as_py()
+        yield model_type, segment_count, table.filter(pc.field("model_type_id") == model_type)
 
-    field_column_str = file_path.split(os.sep)[-2]
-    field_column = int(field_column_str[field_column_str.rfind("=") + 1 :])
+
+def measure_file_and_its_columns(configuration: Configuration, file_path: str) -> FileMeasurement:
+    return measure_table_and_its_columns(configuration, file_path, parquet.read_table(file_path))
+
+
+def measure_table_and_its_columns(configuration: Configuration, file_path: str, table: Table) -> FileMeasurement:
+    field_column = parse_field_column(file_path)
 
     rust_size_in_bytes = os.path.getsize(file_path)
     python_size_in_bytes = write_table(configuration, table)
 
-    model_types_used = Counter()
-    # model_types_size_in_bytes = None
     python_size_in_bytes_per_column = Counter()
     for field in table.schema:
         column = table.column(field.name)
-        if field.name == "model_type_id":
-            for value in column:
-                model_types_used[value.as_py()] += 1
         column_schema = pyarrow.schema(pyarrow.struct([field]))
         column_table = Table.from_arrays([column], schema=column_schema)
         python_size_in_bytes_per_column[field.name] = write_table(
             configuration, column_table
         )
-        
-    model_types_size_in_bytes = compute_model_size_with_python_size_in_bytes(configuration, table)
-    _ = results.execute(
-        f"INSERT INTO file VALUES({field_column}, {rust_size_in_bytes}, {python_size_in_bytes})"
+
+    # The residuals column is already measured above so it is not encoded again.
+    model_types_used_and_size_in_bytes = compute_model_types_used_and_size_in_bytes(
+        configuration, table, python_size_in_bytes_per_column["residuals"]
+    )
+    data_point_count = count_data_points(configuration, table)
+    measurement = FileMeasurement(
+        (field_column, rust_size_in_bytes, python_size_in_bytes, data_point_count), [], [], [], []
     )
-    # results.commit()
-    
-    for model_type_id, segment_count in model_types_used.items():
-        _ = results.execute(
-            f"INSERT INTO model_type_use VALUES({field_column}, {model_type_id}, {segment_count}, {model_types_size_in_bytes[model_type_id]})"
-        )
-        # results.commit()
+
+    for model_type_id, (segment_count, model_type_size_in_bytes) in model_types_used_and_size_in_bytes.items():
+        measurement.model_type_use.append((field_column, model_type_id, segment_count, model_type_size_in_bytes))
 
     for column_index, (column_name, python_size_in_bytes) in enumerate(
         python_size_in_bytes_per_column.items()
     ):
-        _ = results.execute(
-            f"INSERT INTO file_column VALUES({field_column}, {column_index}, '{column_name}', {python_size_in_bytes})"
+        measurement.file_column.append((field_column, column_index, column_name, python_size_in_bytes))
+    return measurement
+
+
+def measure_and_sweep_file_and_its_columns(
+    configuration: Configuration, file_path: str, executor: ThreadPoolExecutor = None
+) -> FileMeasurement:
+    # The file is only read once and then both measured with the configuration
+    # and encoded with each configuration in the grid, per column and model type.
+    # The encodings are computed by the executor if given, map() returns them in
+    # order so the results are the same as when they are computed serially.
+    table = parquet.read_table(file_path)
+    measurement = measure_table_and_its_columns(configuration, file_path, table)
+    field_column = measurement.file[0]
+
+    sweeps = []
+    for field in table.schema:
+        sweeps.append((None, table.select([field.name])))
+    for model_type_id, _segment_count, model_type_table in split_by_model_type(table):
+        for column_name in ["min_value", "max_value", "values"]:
+            sweeps.append((model_type_id, model_type_table.select([column_name])))
+
+    encodings = [
+        (model_type_id, column_table, sweep_configuration)
+        for model_type_id, column_table in sweeps
+        for sweep_configuration in list_sweep_configurations(configuration, column_table.schema.field(0).type)
+    ]
+    map_encodings = executor.map if executor is not None else map
+    sizes_in_bytes = map_encodings(lambda encoding: write_table(encoding[2], encoding[1]), encodings)
+
+    for (model_type_id, column_table, sweep_configuration), size_in_bytes in zip(encodings, sizes_in_bytes):
+        measurement.encoding_use.append(
+            (field_column, model_type_id, column_table.column_names[0])
+            + describe_encoding(sweep_configuration)
+            + (size_in_bytes,)
         )
-    results.commit()
+    return measurement
+
+
+def list_sweep_configurations(configuration: Configuration, data_type: pyarrow.DataType) -> list[Configuration]:
+    # Dictionary encoding falls back to PLAIN so no other encoding is set with it.
+    encodings = [("PLAIN", False), (None, True)]
+    if pyarrow.types.is_floating(data_type):
+        encodings.append(("BYTE_STREAM_SPLIT", False))
+    if pyarrow.types.is_integer(data_type) or pyarrow.types.is_timestamp(data_type):
+        encodings.append(("DELTA_BINARY_PACKED", False))
+
+    # The configuration is always included so the grid can be compared to it.
+    sweep_configurations = [configuration]
+    for compression, compression_level in SWEEP_COMPRESSIONS:
+        for column_encoding, use_dictionary in encodings:
+            for data_page_size in SWEEP_DATA_PAGE_SIZES:
+                sweep_configuration = replace(
+                    configuration,
+                    compression=compression,
+                    compression_level=compression_level,
+                    column_encoding=column_encoding,
+                    use_dictionary=use_dictionary,
+                    data_page_size=data_page_size,
+                )
+                if sweep_configuration != configuration:
+                    sweep_configurations.append(sweep_configuration)
+    return sweep_configurations
+
+
+def describe_encoding(configuration: Configuration) -> tuple:
+    return (
+        configuration.compression,
+        configuration.compression_level,
+        configuration.column_encoding or "DICTIONARY",
+        configuration.use_dictionary,
+        configuration.data_page_size,
+    )
+
+
+def estimate_file_and_its_columns(configuration: Configuration, file_path: str) -> FileMeasurement:
+    # Only the footer is read, so the sizes are those of the column chunks
+    # written by ModelarDB instead of the sizes when re-encoded in Python.
+    parquet_file = parquet.ParquetFile(file_path)
+    metadata = parquet_file.metadata
+    field_column = parse_field_column(file_path)
+
+    rust_size_in_bytes = os.path.getsize(file_path)
+    measurement = FileMeasurement((field_column, rust_size_in_bytes, 0, None), [], [], [], [])
+
+    compressed_size_in_bytes_per_column = Counter()
+    for row_group_index in range(metadata.num_row_groups):
+        row_group = metadata.row_group(row_group_index)
+        for column_index, column_name in enumerate(metadata.schema.names):
+            column_chunk = row_group.column(column_index)
+            compressed_size_in_bytes_per_column[column_name] += column_chunk.total_compressed_size
+            measurement.column_chunk.append(
+                (
+                    field_column,
+                    column_index,
+                    column_name,
+                    row_group_index,
+                    column_chunk.total_compressed_size,
+                    column_chunk.total_uncompressed_size,
+                )
+            )
+
+    # The number of data points cannot be derived from the footer, so the
+    # segments' start and end times are read if the sampling interval is known.
+    data_point_count = None
+    if configuration.sampling_interval_in_us:
+        data_point_count = count_data_points(configuration, parquet_file.read(columns=["start_time", "end_time"]))
+
+    python_size_in_bytes = sum(compressed_size_in_bytes_per_column.values())
+    measurement.file = (field_column, rust_size_in_bytes, python_size_in_bytes, data_point_count)
+
+    # The size of each model type cannot be derived from the footer so it is NULL.
+    for model_type_id, segment_count in sorted(count_model_types_used(parquet_file).items()):
+        measurement.model_type_use.append((field_column, model_type_id, segment_count, None))
+
+    for column_index, (column_name, compressed_size_in_bytes) in enumerate(
+        compressed_size_in_bytes_per_column.items()
+    ):
+        measurement.file_column.append((field_column, column_index, column_name, compressed_size_in_bytes))
+    return measurement
+
+
+def count_model_types_used(parquet_file: parquet.ParquetFile) -> Counter:
+    # Row groups that only contain one model type are counted from their
+    # statistics, only model_type_id is read for the remaining row groups.
+    metadata = parquet_file.metadata
+    model_type_id_index = metadata.schema.names.index("model_type_id")
+
+    model_types_used = Counter()
+    row_groups_to_read = []
+    for row_group_index in range(metadata.num_row_groups):
+        row_group = metadata.row_group(row_group_index)
+        statistics = row_group.column(model_type_id_index).statistics
+        if statistics is not None and statistics.has_min_max and statistics.min == statistics.max:
+            model_types_used[statistics.min] += row_group.num_rows
+        else:
+            row_groups_to_read.append(row_group_index)
+
+    if row_groups_to_read:
+        model_type_ids = parquet_file.read_row_groups(row_groups_to_read, columns=["model_type_id"])
+        for model_type_count in pc.value_counts(model_type_ids.column("model_type_id")):
+            model_types_used[model_type_count["values"].as_py()] += model_type_count["counts"].as_py()
+    return model_types_used
+
+
+def count_data_points(configuration: Configuration, table: Table) -> int:
+    # Estimate the number of data points by assuming each segment represents
+    # a regular time series, so it is NULL if the sampling interval is unknown.
+    if not configuration.sampling_interval_in_us:
+        return None
+
+    start_times = table.column("start_time").cast(pyarrow.timestamp("us")).cast(pyarrow.int64())
+    end_times = table.column("end_time").cast(pyarrow.timestamp("us")).cast(pyarrow.int64())
+    data_points_per_segment = pc.add(
+        pc.divide(pc.subtract(end_times, start_times), configuration.sampling_interval_in_us), 1
+    )
+    return pc.sum(data_points_per_segment).as_py() or 0
+
+
+def parse_field_column(file_path: str) -> int:
+    field_column_str = file_path.split(os.sep)[-2]
+    return int(field_column_str[field_column_str.rfind("=") + 1 :])
+
+
+def insert_measurement(file_identity: tuple, measurement: FileMeasurement, results: sqlite3.Connection):
+    # Parameters are bound so sizes that cannot be measured are stored as NULL.
+    # Each row includes the path of the file so it can be evicted if it changes.
+    # The transaction is committed by the caller once all files are inserted.
+    file_path = (file_identity[0],)
+    _ = results.execute("INSERT INTO file VALUES(?, ?, ?, ?, ?)", measurement.file + file_path)
+    _ = results.executemany(
+        "INSERT INTO model_type_use VALUES(?, ?, ?, ?, ?)",
+        (model_type_use + file_path for model_type_use in measurement.model_type_use),
+    )
+    _ = results.executemany(
+        "INSERT INTO file_column VALUES(?, ?, ?, ?, ?)",
+        (file_column + file_path for file_column in measurement.file_column),
+    )
+    _ = results.executemany(
+        "INSERT INTO column_chunk VALUES(?, ?, ?, ?, ?, ?, ?)",
+        (column_chunk + file_path for column_chunk in measurement.column_chunk),
+    )
+    _ = results.executemany(
+        "INSERT INTO encoding_use VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (encoding_use + file_path for encoding_use in measurement.encoding_use),
+    )
+    _ = results.execute("INSERT INTO measured_file VALUES(?, ?, ?, ?)", file_identity)
 
 
 def write_table(configuration: Configuration, table: Table) -> int:
-    with tempfile.NamedTemporaryFile() as temp_file_path:
-        parquet.write_table(
-            table,
-            temp_file_path.name,
-            data_page_size=configuration.data_page_size,
-            row_group_size=configuration.row_group_size,
-            column_encoding=configuration.column_encoding,
-            compression=configuration.compression,
-            use_dictionary=configuration.use_dictionary,
-            write_statistics=configuration.write_statistics,
-        )
-        return os.path.getsize(temp_file_path.name)
+    if configuration.measure_on_disk:
+        with tempfile.NamedTemporaryFile() as temp_file_path:
+            write_table_to(configuration, table, temp_file_path.name)
+            return os.path.getsize(temp_file_path.name)
+
+    # The sink only counts the bytes written to it so nothing is written to disk.
+    sink = pyarrow.MockOutputStream()
+    write_table_to(configuration, table, sink)
+    return sink.size()
+
+
+def write_table_to(configuration: Configuration, table: Table, where):
+    parquet.write_table(
+        table,
+        where,
+        data_page_size=configuration.data_page_size,
+        row_group_size=configuration.row_group_size,
+        column_encoding=configuration.column_encoding,
+        compression=configuration.compression,
+        compression_level=configuration.compression_level,
+        use_dictionary=configuration.use_dictionary,
+        write_statistics=configuration.write_statistics,
+    )
 
 
 def read_column_indices_column_names(
     data_folder: str, model_table_name: str
 ) -> dict[int, str]:
     model_table_field_columns = parquet.read_table(
-        sys.argv[1] + "/metadata/model_table_field_columns",
-        filters=[("table_name", "==", sys.argv[2])],
+        data_folder + "/metadata/model_table_field_columns",
+        filters=[("table_name", "==", model_table_name)],
     )
     column_indices = model_table_field_columns.column("column_index")
     column_names = model_table_field_columns.column("column_name")
@@ -152,34 +517,34 @@ def read_column_indices_column_names(
 def print_results(
     column_indices_column_names: dict[int, str], results: sqlite3.Connection
 ):
-    field_columns = execute_and_return_value(
-        "SELECT DISTINCT field_column FROM file ORDER BY field_column", results
+    # Each table is aggregated by one grouped query for all field columns.
+    model_types_used = defaultdict(dict)
+    for field_column, model_type_id, segment_count, size_in_bytes in results.execute(
+        "SELECT field_column, model_type_id, SUM(segment_count), SUM(python_size_in_bytes) FROM model_type_use GROUP BY field_column, model_type_id ORDER BY field_column, model_type_id"
+    ):
+        model_types_used[field_column][model_type_id] = {"segment_size": segment_count, "bytes": size_in_bytes}
+
+    python_size_in_bytes_per_column = defaultdict(dict)
+    for field_column, column_name, size_in_bytes in results.execute(
+        "SELECT field_column, column_name, SUM(python_size_in_bytes) FROM file_column GROUP BY field_column, column_index ORDER BY field_column, column_index"
+    ):
+        python_size_in_bytes_per_column[field_column][column_name] = size_in_bytes
+
+    uncompressed_size_in_bytes = dict(
+        results.execute("SELECT field_column, SUM(uncompressed_size_in_bytes) FROM column_chunk GROUP BY field_column")
     )
-    for field_column in field_columns:
-        model_types_used = execute_and_return_value(
-            f"SELECT model_type_id, SUM(segment_count), SUM(python_size_in_bytes) FROM model_type_use WHERE field_column = {field_column} GROUP BY model_type_id ORDER BY model_type_id",
-            results,
-        )
-        rust_size_in_bytes = execute_and_return_value(
-            f"SELECT SUM(rust_size_in_bytes) FROM file WHERE field_column = {field_column}",
-            results,
-        )
-        python_size_in_bytes = execute_and_return_value(
-            f"SELECT SUM(python_size_in_bytes) FROM file WHERE field_column = {field_column}",
-            results,
-        )
-        python_size_in_bytes_per_column = execute_and_return_value(
-            f"SELECT column_name, SUM(python_size_in_bytes) FROM file_column WHERE field_column = {field_column} GROUP BY column_index ORDER BY column_index",
-            results,
-        )
 
+    for field_column, rust_size_in_bytes, python_size_in_bytes in results.execute(
+        "SELECT field_column, SUM(rust_size_in_bytes), SUM(python_size_in_bytes) FROM file GROUP BY field_column ORDER BY field_column"
+    ).fetchall():
         print_total_size_in_bytes(
             field_column,
             column_indices_column_names[field_column],
-            model_types_used,
+            model_types_used[field_column],
             rust_size_in_bytes,
             python_size_in_bytes,
-            python_size_in_bytes_per_column,
+            python_size_in_bytes_per_column[field_column],
+            uncompressed_size_in_bytes.get(field_column),
         )
 
     model_types_used = execute_and_return_value(
@@ -196,6 +561,9 @@ def print_results(
         f"SELECT column_name, SUM(python_size_in_bytes) FROM file_column GROUP BY column_index ORDER BY column_index",
         results,
     )
+    uncompressed_size_in_bytes = execute_and_return_value(
+        f"SELECT SUM(uncompressed_size_in_bytes) FROM column_chunk", results
+    )
 
     print_total_size_in_bytes(
         "All",
@@ -204,9 +572,77 @@ def print_results(
         rust_size_in_bytes,
         python_size_in_bytes,
         python_size_in_bytes_per_column,
+        uncompressed_size_in_bytes,
     )
 
 
+def print_sweep_results(configuration: Configuration, results: sqlite3.Connection):
+    # The sizes are summed over all files before the smallest encoding is
+    # selected as a column can only be written with one encoding.
+    encoding_uses = results.execute(
+        """SELECT model_type_id, column_name, compression, compression_level, column_encoding, use_dictionary, data_page_size, SUM(python_size_in_bytes)
+           FROM encoding_use GROUP BY model_type_id, column_name, compression, compression_level, column_encoding, use_dictionary, data_page_size"""
+    ).fetchall()
+
+    current_encoding = describe_encoding(configuration)
+    current_sizes_in_bytes = {}
+    smallest_encodings = {}
+    for model_type_id, column_name, *encoding, size_in_bytes in encoding_uses:
+        key = (-1 if model_type_id is None else model_type_id, column_name)
+        if tuple(encoding) == current_encoding:
+            current_sizes_in_bytes[key] = size_in_bytes
+        if key not in smallest_encodings or size_in_bytes < smallest_encodings[key][1]:
+            smallest_encodings[key] = (encoding, size_in_bytes)
+
+    print("Smallest Encoding per Column and Model Type")
+    print("------------------------------------------")
+    for (model_type_id, column_name), (encoding, size_in_bytes) in sorted(smallest_encodings.items()):
+        model_type_name = "All" if model_type_id == -1 else MODEL_TYPE_ID_TO_NAME[model_type_id]
+        current_size_in_bytes = current_sizes_in_bytes[(model_type_id, column_name)]
+        saved_percentage = 100 * (1 - size_in_bytes / current_size_in_bytes) if current_size_in_bytes else 0.0
+        compression, compression_level, column_encoding, use_dictionary, data_page_size = encoding
+        compression_name = compression if compression_level is None else f"{compression}({compression_level})"
+        print(
+            f"- {model_type_name:<8} {column_name:<15} {bytes_to_mib(current_size_in_bytes):>10} MiB "
+            f"-> {bytes_to_mib(size_in_bytes):>10} MiB ({saved_percentage:5.1f}% saved) "
+            f"{compression_name} {column_encoding} {data_page_size} B pages"
+        )
+    print()
+
+
+def export_results(
+    column_indices_column_names: dict[int, str], results: sqlite3.Connection, export_folder: str, export_format: str
+):
+    os.makedirs(export_folder, exist_ok=True)
+    for table_name, query in EXPORT_QUERIES.items():
+        cursor = results.execute(query)
+        rows = cursor.fetchall()
+        column_names = [description[0] for description in cursor.description]
+        cursor.close()
+
+        columns = list(zip(*rows)) if rows else [[] for _ in column_names]
+        table = pyarrow.table(dict(zip(column_names, columns)))
+
+        # The names are included so the results can be used without the metadata.
+        field_names = [
+            column_indices_column_names.get(field_column) for field_column in table.column("field_column").to_pylist()
+        ]
+        table = table.add_column(1, "field_name", pyarrow.array(field_names, pyarrow.string()))
+
+        export_path = os.path.join(export_folder, f"{table_name}.{export_format}")
+        if export_format == "csv":
+            csv.write_csv(table, export_path)
+        else:
+            parquet.write_table(table, export_path)
+
+
+def execute_and_return_list(query: str, results: sqlite3.Connection) -> list:
+    cursor = results.execute(query)
+    values = cursor.fetchall()
+    cursor.close()
+    return [value[0] for value in values]
+
+
 def execute_and_return_value(query: str, results: sqlite3.Connection):
     cursor = results.execute(query)
     values = cursor.fetchall()
@@ -230,13 +666,16 @@ def print_total_size_in_bytes(
     rust_size_in_bytes: int,
     python_size_in_bytes: int,
     python_size_in_bytes_per_column: dict[str, int],
+    uncompressed_size_in_bytes: int = None,
 ):
     print(f"Field Column: {field_column} - {field_name}")
     print("------------------------------------------")
 
     for model_type_id, count in model_types_used.items():
         model_type_name = MODEL_TYPE_ID_TO_NAME[model_type_id]
-        print(f"- {model_type_name} {count['segment_size']:>15} Segments, {count['bytes']:>5} B")
+        # The size is NULL when only the metadata of the files are read.
+        size_in_bytes = "?" if count["bytes"] is None else count["bytes"]
+        print(f"- {model_type_name} {count['segment_size']:>15} Segments, {size_in_bytes:>5} B")
     print("------------------------------------------")
 
     summed_size_in_bytes = 0
@@ -248,6 +687,8 @@ def print_total_size_in_bytes(
     print(f"- Summed Size {bytes_to_mib(summed_size_in_bytes):>24} MiB")
     print(f"- Python Size {bytes_to_mib(python_size_in_bytes):>24} MiB")
     print(f"- Rust Size {bytes_to_mib(rust_size_in_bytes):>26} MiB")
+    if uncompressed_size_in_bytes is not None:
+        print(f"- Uncompressed Size {bytes_to_mib(uncompressed_size_in_bytes):>18} MiB")
     print()
 
 
@@ -255,33 +696,267 @@ def bytes_to_mib(size_in_bytes: int) -> float:
     return round(size_in_bytes / 1024 / 1024, 2)
 
 
-def main():
-    if len(sys.argv) != 3 and len(sys.argv) != 4:
-        print(f"Usage: python3 {__file__} data_folder model_table_name [database_file]")
-        # print(f"{len(sys.argv)}")
-        return
-    database_file = sys.argv[3] if len(sys.argv) == 4 else ":memory:"
-    # All results are stored in SQLite to simplify aggregating them.
-    results: sqlite3.Connection = sqlite3.connect(database_file)
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Compute the storage used by each field column and model type in a model table."
+    )
+    parser.add_argument("data_folder", help="folder ModelarDB stores its data in")
+    parser.add_argument("model_table_name", help="name of the model table to analyze")
+    parser.add_argument(
+        "database_file",
+        nargs="?",
+        default=":memory:",
+        help="SQLite file to store the results in, files already measured in it are only measured again if changed",
+    )
+    parser.add_argument(
+        "--on-disk",
+        action="store_true",
+        help="measure sizes by writing temporary files to disk instead of in memory, for comparison",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes measuring files in parallel, or with --sweep threads encoding the columns of each"
+        " file in parallel (default: 1)",
+    )
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="also encode each column and model type with a grid of codecs, encodings, and page sizes and report the"
+        " smallest, this encodes each column hundreds of times so use --jobs to encode them in parallel",
+    )
+    parser.add_argument(
+        "--compare",
+        action="append",
+        metavar="LABEL=DATA_FOLDER",
+        help="also analyze the data folder of another version and compare it to data_folder, can be repeated,"
+        " the labels must be unique and differ from the name of data_folder",
+    )
+    parser.add_argument(
+        "--export",
+        metavar="FOLDER",
+        help="also write the results aggregated per field column to FOLDER for further analysis",
+    )
+    parser.add_argument(
+        "--export-format",
+        choices=["parquet", "csv"],
+        default="parquet",
+        help="file format of the exported results (default: parquet)",
+    )
+    parser.add_argument(
+        "--watch",
+        type=float,
+        metavar="SECONDS",
+        help="poll for new files every SECONDS, measure them with --fast, and print the totals until interrupted",
+    )
+    parser.add_argument(
+        "--sampling-interval-us",
+        type=int,
+        help="sampling interval of the ingested time series, used to estimate the number of data points",
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="estimate sizes from the metadata of each file instead of re-encoding it, sizes per model type are unknown",
+    )
+    arguments = parser.parse_args()
+
+    # The versions are summarized and compared, so there are no per-version results to watch or sweep.
+    if arguments.compare and (arguments.watch is not None or arguments.sweep):
+        parser.error("--compare cannot be used with --watch or --sweep")
+    return arguments
+
+
+def create_tables(results: sqlite3.Connection):
+    # All results are stored in SQLite to simplify aggregating them. The tables
+    # are reused if they exist so the results also work as a cache across runs.
     _ = results.execute(
-        """CREATE TABLE file(field_column INTEGER, rust_size_in_bytes INTEGER, python_size_in_bytes INTEGER) STRICT"""
+        """CREATE TABLE IF NOT EXISTS file(field_column INTEGER, rust_size_in_bytes INTEGER, python_size_in_bytes INTEGER, data_point_count INTEGER, file_path TEXT) STRICT"""
     )
     _ = results.execute(
-        """CREATE TABLE model_type_use(field_column INTEGER, model_type_id INTEGER, segment_count INTEGER, python_size_in_bytes INTEGER) STRICT"""
+        """CREATE TABLE IF NOT EXISTS model_type_use(field_column INTEGER, model_type_id INTEGER, segment_count INTEGER, python_size_in_bytes INTEGER, file_path TEXT) STRICT"""
     )
     _ = results.execute(
-        """CREATE TABLE file_column(field_column INTEGER, column_index INTEGER, column_name TEXT, python_size_in_bytes INTEGER) STRICT"""
+        """CREATE TABLE IF NOT EXISTS file_column(field_column INTEGER, column_index INTEGER, column_name TEXT, python_size_in_bytes INTEGER, file_path TEXT) STRICT"""
     )
+    _ = results.execute(
+        """CREATE TABLE IF NOT EXISTS column_chunk(field_column INTEGER, column_index INTEGER, column_name TEXT, row_group INTEGER, compressed_size_in_bytes INTEGER, uncompressed_size_in_bytes INTEGER, file_path TEXT) STRICT"""
+    )
+    _ = results.execute(
+        """CREATE TABLE IF NOT EXISTS encoding_use(field_column INTEGER, model_type_id INTEGER, column_name TEXT, compression TEXT, compression_level INTEGER, column_encoding TEXT, use_dictionary INTEGER, data_page_size INTEGER, python_size_in_bytes INTEGER, file_path TEXT) STRICT"""
+    )
+    _ = results.execute(
+        """CREATE TABLE IF NOT EXISTS measured_file(file_path TEXT PRIMARY KEY, size_in_bytes INTEGER, modified_time_in_ns INTEGER, configuration TEXT) STRICT"""
+    )
+
+    # The results are aggregated by field column and model type and evicted by file.
+    _ = results.execute("CREATE INDEX IF NOT EXISTS file_field_column ON file(field_column)")
+    _ = results.execute(
+        "CREATE INDEX IF NOT EXISTS model_type_use_field_column ON model_type_use(field_column, model_type_id)"
+    )
+    _ = results.execute("CREATE INDEX IF NOT EXISTS file_column_field_column ON file_column(field_column, column_index)")
+    _ = results.execute("CREATE INDEX IF NOT EXISTS column_chunk_field_column ON column_chunk(field_column)")
+    _ = results.execute(
+        "CREATE INDEX IF NOT EXISTS encoding_use_model_type_id ON encoding_use(model_type_id, column_name)"
+    )
+    for table_name in ["file", "model_type_use", "file_column", "column_chunk", "encoding_use"]:
+        _ = results.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_file_path ON {table_name}(file_path)")
     results.commit()
 
-    configuration = Configuration(sys.argv[1], sys.argv[2])
-    list_and_process_files(configuration, results)
+
+def main():
+    arguments = parse_arguments()
+    if arguments.compare:
+        compare_versions(arguments)
+        return
+
+    results: sqlite3.Connection = sqlite3.connect(arguments.database_file)
+    create_tables(results)
+
+    configuration = create_configuration(arguments, arguments.data_folder)
+    if arguments.watch:
+        watch_files(configuration, results, arguments.watch)
+    else:
+        list_and_process_files(configuration, results, arguments.jobs)
+
+    # Watching may be stopped before ModelarDB has written any files.
+    if execute_and_return_value("SELECT COUNT(*) FROM file", results) == 0:
+        print("No files measured.")
+        return
 
     column_indices_column_names = read_column_indices_column_names(
-        sys.argv[1], sys.argv[2]
+        arguments.data_folder, arguments.model_table_name
     )
     print_results(column_indices_column_names, results)
+    if configuration.sweep_encodings:
+        print_sweep_results(configuration, results)
 
+    if arguments.export:
+        export_results(column_indices_column_names, results, arguments.export, arguments.export_format)
+
+
+def create_configuration(arguments, data_folder: str) -> Configuration:
+    return Configuration(
+        data_folder,
+        arguments.model_table_name,
+        measure_on_disk=arguments.on_disk,
+        metadata_only=arguments.fast or arguments.watch is not None,
+        sweep_encodings=arguments.sweep,
+        sampling_interval_in_us=arguments.sampling_interval_us,
+    )
+
+
+def compare_versions(arguments):
+    # The data folder given first is the version the others are compared to.
+    versions = [(os.path.basename(os.path.normpath(arguments.data_folder)), arguments.data_folder)]
+    for version in arguments.compare:
+        label, separator, data_folder = version.partition("=")
+        if not separator:
+            raise ValueError(f"{version} is not in the format LABEL=DATA_FOLDER.")
+
+        # The label names the results database and export folder of each version so they must be unique.
+        if label in [existing_label for existing_label, _data_folder in versions]:
+            raise ValueError(f"{label} is used for multiple versions, the labels must be unique.")
+        versions.append((label, data_folder))
+
+    # The versions are analyzed one at a time so their output is not interleaved,
+    # the files in each version are still measured in parallel with --jobs.
+    summaries = [analyze_version(arguments, label, data_folder) for label, data_folder in versions]
+
+    column_indices_column_names = read_column_indices_column_names(
+        arguments.data_folder, arguments.model_table_name
+    )
+    print_comparison([label for label, _data_folder in versions], summaries, column_indices_column_names)
+
+
+def analyze_version(arguments, label: str, data_folder: str) -> dict:
+    database_file = arguments.database_file
+    if database_file != ":memory:":
+        root, extension = os.path.splitext(database_file)
+        database_file = f"{root}-{label}{extension}"
+
+    print(f"Analyzing {label} in {data_folder}")
+    results: sqlite3.Connection = sqlite3.connect(database_file)
+    create_tables(results)
+    configuration = create_configuration(arguments, data_folder)
+    list_and_process_files(configuration, results, arguments.jobs)
+
+    if arguments.export:
+        column_indices_column_names = read_column_indices_column_names(data_folder, arguments.model_table_name)
+        export_folder = os.path.join(arguments.export, label)
+        export_results(column_indices_column_names, results, export_folder, arguments.export_format)
+
+    summary = summarize_results(results)
+    results.close()
+    return summary
+
+
+def summarize_results(results: sqlite3.Connection) -> dict:
+    # Return the sizes and segments per field column and model type with the
+    # totals for all field columns stored for the field column named All.
+    summary = {"file": defaultdict(lambda: [0, 0]), "model_type_use": defaultdict(dict)}
+    for field_column, _file_count, rust_size_in_bytes, python_size_in_bytes, _data_point_count in results.execute(
+        EXPORT_QUERIES["file"]
+    ):
+        for key in [field_column, "All"]:
+            summary["file"][key][0] += rust_size_in_bytes
+            summary["file"][key][1] += python_size_in_bytes
+
+    for field_column, model_type_id, segment_count, python_size_in_bytes in results.execute(
+        EXPORT_QUERIES["model_type_use"]
+    ):
+        for key in [field_column, "All"]:
+            total_segment_count, total_size_in_bytes = summary["model_type_use"][key].get(model_type_id, (0, 0))
+            if python_size_in_bytes is None or total_size_in_bytes is None:
+                total_size_in_bytes = None
+            else:
+                total_size_in_bytes += python_size_in_bytes
+            summary["model_type_use"][key][model_type_id] = (total_segment_count + segment_count, total_size_in_bytes)
+    return summary
+
+
+def print_comparison(labels: list[str], summaries: list[dict], column_indices_column_names: dict[int, str]):
+    field_columns = sorted(set().union(*[summary["file"].keys() - {"All"} for summary in summaries]))
+    for field_column in field_columns + ["All"]:
+        field_name = column_indices_column_names.get(field_column, "Summed")
+        print(f"Field Column: {field_column} - {field_name}")
+        print("-" * (22 + 32 * len(labels)))
+        print(f"{'':<22}" + "".join(f"{label:>32}" for label in labels))
+
+        rows = [
+            ("Rust Size MiB", [summary["file"].get(field_column, [None, None])[0] for summary in summaries], True),
+            ("Python Size MiB", [summary["file"].get(field_column, [None, None])[1] for summary in summaries], True),
+        ]
+        model_type_ids = sorted(
+            set().union(*[summary["model_type_use"].get(field_column, {}).keys() for summary in summaries])
+        )
+        for model_type_id in model_type_ids:
+            model_types_used = [
+                summary["model_type_use"].get(field_column, {}).get(model_type_id, (None, None))
+                for summary in summaries
+            ]
+            model_type_name = MODEL_TYPE_ID_TO_NAME[model_type_id]
+            rows.append((f"{model_type_name} Segments", [segments for segments, _size in model_types_used], False))
+            rows.append((f"{model_type_name} MiB", [size for _segments, size in model_types_used], True))
+
+        for name, values, is_size in rows:
+            cells = [format_comparison(value, values[0], is_size) for value in values]
+            print(f"- {name:<20}" + "".join(f"{cell:>32}" for cell in cells))
+        print()
+
+
+def format_comparison(value: int, reference_value: int, is_size: bool) -> str:
+    # Each value is followed by its delta and ratio to the reference version.
+    if value is None:
+        return "-"
+
+    text = str(bytes_to_mib(value)) if is_size else str(value)
+    if reference_value is None or reference_value == 0:
+        return text
+
+    delta = bytes_to_mib(value - reference_value) if is_size else value - reference_value
+    return f"{text} ({delta:+}, {value / reference_value:.2f}x)"
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""Read the results of queries executed through the Apache Arrow Flight interface
+of ModelarDB. The record batches are either collected once in linear time or
+written to Parquet files as they arrive so large results use bounded memory.
+Multiple queries can be executed concurrently with a bounded number of streams.
+"""
+import os
+from typing import Any, Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow
+from pyarrow import flight
+from pyarrow import parquet
+
+
+# The number of rows per row group used by parquet.write_table() by default,
+# which pyarrow 15 lowered from 64Mi rows, e.g., in the pinned pyarrow 11, to 1Mi rows.
+if int(pyarrow.__version__.split(".")[0]) >= 15:
+    DEFAULT_ROW_GROUP_SIZE = 1024 * 1024
+else:
+    DEFAULT_ROW_GROUP_SIZE = 64 * 1024 * 1024
+
+
+def do_get(flight_client: flight.FlightClient, query: str) -> flight.FlightStreamReader:
+    return flight_client.do_get(flight.Ticket(query))
+
+
+def read_table(flight_client: flight.FlightClient, query: str) -> pyarrow.Table:
+    # The batches are collected once instead of concatenating a table per batch.
+    return do_get(flight_client, query).read_all()
+
+
+def read_row_count(flight_client: flight.FlightClient, query: str) -> int:
+    # The batches are read to ensure all data is retrieved but are not kept.
+    return sum(record_batch.num_rows for record_batch in read_record_batches(do_get(flight_client, query)))
+
+
+def execute_queries(
+    flight_client: flight.FlightClient,
+    queries: Iterable[str],
+    read_result: Callable[[flight.FlightClient, str], Any] = read_table,
+    max_in_flight_streams: int = 8,
+) -> Iterator[Any]:
+    # Execute the queries concurrently and yield what read_result returns for
+    # each in the order of the queries. Each thread reads its stream to the end
+    # before starting the next query, so at most max_in_flight_streams are open.
+    with ThreadPoolExecutor(max_workers=max_in_flight_streams) as executor:
+        yield from executor.map(lambda query: read_result(flight_client, query), queries)
+
+
+def read_record_batches(flight_stream_reader: flight.FlightStreamReader) -> Iterator[pyarrow.RecordBatch]:
+    for flight_stream_chunk in flight_stream_reader:
+        yield flight_stream_chunk.data
+
+
+def write_record_batches_per_column(
+    record_batches: Iterator[pyarrow.RecordBatch],
+    schema: pyarrow.Schema,
+    output_columns: dict[str, list[str]],
+    compression: str = "snappy",
+    min_row_count: int = 0,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+) -> dict[str, int]:
+    # Write the columns in output_columns for each record batch to the Parquet
+    # file they are mapped from. Files with min_row_count rows or fewer are
+    # removed, and the number of rows in each of the remaining files is returned.
+    # The batches are buffered until they fill a row group of row_group_size
+    # rows instead of being written as one small row group per batch received.
+    # By default, the files have the same row groups as when the result is
+    # written at once by parquet.write_table() of the installed pyarrow, and
+    # before pyarrow 15 this means results of up to 64Mi rows are buffered.
+    parquet_writers = {}
+    buffered_tables = {}
+    row_counts = {}
+    try:
+        for output_path, column_names in output_columns.items():
+            output_schema = pyarrow.schema([schema.field(column_name) for column_name in column_names])
+            parquet_writers[output_path] = parquet.ParquetWriter(output_path, output_schema, compression=compression)
+            buffered_tables[output_path] = []
+            row_counts[output_path] = 0
+
+        buffered_row_count = 0
+        for record_batch in record_batches:
+            table = pyarrow.Table.from_batches([record_batch], schema=schema)
+            for output_path, column_names in output_columns.items():
+                buffered_tables[output_path].append(table.select(column_names))
+                row_counts[output_path] += record_batch.num_rows
+
+            # All files receive the same rows, so they all fill a row group at the same time.
+            buffered_row_count += record_batch.num_rows
+            if buffered_row_count >= row_group_size:
+                full_row_count = buffered_row_count - buffered_row_count % row_group_size
+                for output_path in output_columns:
+                    buffered_table = pyarrow.concat_tables(buffered_tables[output_path])
+                    parquet_writers[output_path].write_table(
+                        buffered_table.slice(0, full_row_count), row_group_size=row_group_size
+                    )
+                    buffered_tables[output_path] = [buffered_table.slice(full_row_count)]
+                buffered_row_count -= full_row_count
+
+        for output_path in output_columns:
+            if buffered_row_count > 0:
+                parquet_writers[output_path].write_table(
+                    pyarrow.concat_tables(buffered_tables[output_path]), row_group_size=row_group_size
+                )
+    finally:
+        for parquet_writer in parquet_writers.values():
+            parquet_writer.close()
+
+    for output_path, row_count in list(row_counts.items()):
+        if row_count <= min_row_count:
+            os.remove(output_path)
+            del row_counts[output_path]
+    return row_counts
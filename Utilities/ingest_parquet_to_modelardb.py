@@ -2,12 +2,44 @@
 Authors: Søren Kejser Jensen and Christian Schmidt Godiksen.
 """
 import os
-import sys
 import glob
+import json
+import math
+import time
+import queue
+import argparse
+import operator
+import tempfile
+import itertools
+import functools
+import threading
+from datetime import datetime
+from collections import defaultdict
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 
 import pyarrow
+import pyarrow.ipc
+import pyarrow.compute as pc
 from pyarrow import parquet
 from pyarrow import flight
+from pyarrow import dataset
+
+
+# Number of rows read from a file and sent to ModelarDB at a time in streaming mode.
+DEFAULT_BATCH_SIZE = 65536
+
+# Row groups with more rows than this times the batch size are reported as they are decoded entirely.
+LARGE_ROW_GROUP_FACTOR = 16
+
+# Phases timed by IngestionReport in the order they are reported.
+PHASES = ["decode", "cast", "write", "close", "flush"]
+
+# Cast plans computed by get_cast_plan() for each schema fingerprint.
+CAST_PLANS = {}
+
+# Compute functions used by RowFilter to evaluate its comparisons on data.
+COMPARISON_FUNCTIONS = {operator.ge: pc.greater_equal, operator.lt: pc.less, operator.eq: pc.equal}
 
 
 # Helper Functions.
@@ -41,17 +73,162 @@ def create_model_table(flight_client, table_name, schema, error_bound):
     return list(result)
 
 
-def read_parquet_file_or_folder(path):
-    # Read Apache Parquet file or folder.
-    arrow_table = parquet.read_table(path)
-    arrow_table = arrow_table.select([col for col in arrow_table.column_names if col != 'device'])
+def read_parquet_file_or_folder(path, row_groups=None, report=None, row_filter=None):
+    # Read Apache Parquet file or folder, or only row_groups of a file. The
+    # columns and rows in row_filter are pushed down into the Apache Parquet reader.
+    if row_filter is None:
+        row_filter = RowFilter()
+
+    start_time = time.perf_counter()
+    # The schema is read through a dataset as path can also be a folder of files.
+    schema = dataset.dataset(path, format="parquet").schema
+    columns = row_filter.column_names(schema)
+    if row_groups is None:
+        arrow_table = parquet.read_table(path, columns=columns, filters=row_filter.expression(schema))
+    else:
+        row_groups = row_filter.row_groups(path, row_groups)
+        arrow_table = parquet.ParquetFile(path).read_row_groups(row_groups, columns=columns)
+        mask = row_filter.mask(arrow_table)
+        if mask is not None:
+            arrow_table = arrow_table.filter(mask)
+    decoded_time = time.perf_counter()
+
+    # Cast the columns to the supported types.
+    arrow_table, cast_rows, cast_size_in_bytes = get_cast_plan(arrow_table.schema).cast(arrow_table)
+    cast_time = time.perf_counter()
+
+    if report is not None:
+        report.add("decode", path, arrow_table.num_rows, arrow_table.nbytes, decoded_time - start_time)
+        report.add("cast", path, cast_rows, cast_size_in_bytes, cast_time - decoded_time)
+    return arrow_table
+
+
+def read_safe_schema(path, row_filter=None):
+    # Only the footer is read so the schema is known without reading the data.
+    if row_filter is None:
+        row_filter = RowFilter()
+
+    schema = parquet.read_schema(path)
+    column_names = row_filter.column_names(schema)
+    schema = pyarrow.schema([field for field in schema if field.name in column_names])
+    return get_cast_plan(schema).safe_schema
+
+
+class CastPlan:
+    """Casts tables and batches with a specific schema to the safe schema. Only
+    the columns that do not already have a supported type are cast, the other
+    columns are passed through without being copied."""
+
+    def __init__(self, schema):
+        self.safe_schema = compute_safe_schema(schema)
+        self.cast_indices = [
+            index for index, (field, safe_field) in enumerate(zip(schema, self.safe_schema))
+            if field.type != safe_field.type
+        ]
+
+    def cast(self, arrow_data):
+        # Return the cast table or batch and the number of rows and bytes cast.
+        columns = list(arrow_data.columns)
+        cast_size_in_bytes = 0
+        for index in self.cast_indices:
+            cast_size_in_bytes += columns[index].nbytes
+            columns[index] = columns[index].cast(self.safe_schema.field(index).type)
+
+        cast_rows = arrow_data.num_rows if self.cast_indices else 0
+        return type(arrow_data).from_arrays(columns, schema=self.safe_schema), cast_rows, cast_size_in_bytes
 
+
+@dataclass
+class RowFilter:
+    """The field columns and the rows to read from the Apache Parquet files. The
+    timestamp and tag columns are always read. Rows are selected by a time
+    interval [start, end) and by tag columns being equal to the values in tags."""
+
+    fields: list = None
+    start: str = None
+    end: str = None
+    tags: dict = None
+
+    def column_names(self, schema):
+        # Column device is added by us to be able to ingest data to TimescaleDB.
+        column_names = []
+        for field in schema:
+            if field.name == 'device':
+                continue
+            elif pyarrow.types.is_floating(field.type) and self.fields is not None:
+                if field.name in self.fields:
+                    column_names.append(field.name)
+            else:
+                column_names.append(field.name)
+
+        if self.fields is not None:
+            missing = set(self.fields) - set(column_names)
+            if missing:
+                raise ValueError(f"Field columns {sorted(missing)} are not in the file")
+        return column_names
+
+    def predicates(self, schema):
+        # Return (column_name, comparison, value) with values of the column's type.
+        predicates = []
+        if self.start is not None or self.end is not None:
+            timestamp_fields = [field for field in schema if pyarrow.types.is_timestamp(field.type)]
+            if not timestamp_fields:
+                raise ValueError("--start and --end require a timestamp column")
+            timestamp_field = timestamp_fields[0]
+
+            for text, comparison in [(self.start, operator.ge), (self.end, operator.lt)]:
+                if text is not None:
+                    value = pyarrow.scalar(datetime.fromisoformat(text)).cast(timestamp_field.type)
+                    predicates.append((timestamp_field.name, comparison, value))
+
+        for tag, text in (self.tags or {}).items():
+            if tag not in schema.names:
+                raise ValueError(f"Tag column {tag} is not in the file")
+            value = pyarrow.scalar(text).cast(schema.field(tag).type)
+            predicates.append((tag, operator.eq, value))
+        return predicates
+
+    def expression(self, schema):
+        # Expression the Apache Parquet reader uses to skip row groups and rows.
+        expressions = [comparison(pc.field(name), value) for name, comparison, value in self.predicates(schema)]
+        return functools.reduce(operator.and_, expressions) if expressions else None
+
+    def mask(self, arrow_data):
+        masks = [
+            COMPARISON_FUNCTIONS[comparison](arrow_data.column(name), value)
+            for name, comparison, value in self.predicates(arrow_data.schema)
+        ]
+        return functools.reduce(pc.and_, masks) if masks else None
+
+    def row_groups(self, path, row_groups):
+        # Only keep the row groups whose statistics show they may contain matching rows.
+        expression = self.expression(parquet.read_schema(path))
+        if expression is None:
+            return row_groups
+
+        fragment = next(dataset.dataset(path, format="parquet").get_fragments())
+        matching = set(
+            row_group.id
+            for row_group_fragment in fragment.split_by_row_group(filter=expression)
+            for row_group in row_group_fragment.row_groups
+        )
+        return [row_group for row_group in row_groups if row_group in matching]
+
+
+def get_cast_plan(schema):
+    # Plans are cached by the names and types of the columns as files created
+    # by the same tool, e.g., change_schema.py, share the same schema.
+    fingerprint = tuple((field.name, str(field.type)) for field in schema)
+    cast_plan = CAST_PLANS.get(fingerprint)
+    if cast_plan is None:
+        cast_plan = CAST_PLANS.setdefault(fingerprint, CastPlan(schema))
+    return cast_plan
+
+
+def compute_safe_schema(schema):
     # Ensure the schema only uses supported types.
     columns = []
-    column_names = []
-    for field in arrow_table.schema:
-        column_names.append(field.name)
-
+    for field in schema:
         if field.type == pyarrow.float16() or field.type == pyarrow.float64():
             # Ensure fields are float32 as others are not supported.
             columns.append((field.name, pyarrow.float32()))
@@ -65,11 +242,58 @@ def read_parquet_file_or_folder(path):
         else:
             columns.append((field.name, field.type))
 
-    safe_schema = pyarrow.schema(columns)
+    return pyarrow.schema(columns)
 
-    # Cast the columns to the supported types.
-    arrow_table = arrow_table.rename_columns(column_names)
-    return arrow_table.cast(safe_schema)
+
+def read_parquet_file_batches(path, batch_size, row_groups=None, report=None, row_filter=None):
+    # Read the Apache Parquet file one batch at a time so memory use is bounded
+    # by the size of a row group instead of by the size of the file, as each
+    # row group is decoded entirely before it is split into batches. Each batch
+    # is returned with the index of the row group it is read from. Row groups
+    # that cannot contain rows matching row_filter are skipped without being decoded.
+    if row_filter is None:
+        row_filter = RowFilter()
+
+    parquet_file = parquet.ParquetFile(path)
+    column_names = row_filter.column_names(parquet_file.schema_arrow)
+
+    if row_groups is None:
+        row_groups = range(parquet_file.num_row_groups)
+    row_groups = row_filter.row_groups(path, row_groups)
+
+    largest_row_group_rows = max(
+        (parquet_file.metadata.row_group(row_group).num_rows for row_group in row_groups), default=0
+    )
+    if largest_row_group_rows > LARGE_ROW_GROUP_FACTOR * batch_size:
+        print(
+            f"Warning: {path} has row groups with up to {largest_row_group_rows} rows, memory use is bounded"
+            f" by the size of a row group and not by the batch size of {batch_size} rows"
+        )
+
+    for row_group in row_groups:
+        record_batches = parquet_file.iter_batches(
+            batch_size=batch_size, row_groups=[row_group], columns=column_names
+        )
+        while True:
+            start_time = time.perf_counter()
+            record_batch = next(record_batches, None)
+            if record_batch is None:
+                break
+
+            mask = row_filter.mask(record_batch)
+            if mask is not None:
+                record_batch = record_batch.filter(mask)
+                if record_batch.num_rows == 0:
+                    continue
+            decoded_time = time.perf_counter()
+
+            record_batch, cast_rows, cast_size_in_bytes = get_cast_plan(record_batch.schema).cast(record_batch)
+            cast_time = time.perf_counter()
+
+            if report is not None:
+                report.add("decode", path, record_batch.num_rows, record_batch.nbytes, decoded_time - start_time)
+                report.add("cast", path, cast_rows, cast_size_in_bytes, cast_time - decoded_time)
+            yield row_group, record_batch
 
 
 def do_put_arrow_table(flight_client, table_name, arrow_table):
@@ -78,35 +302,751 @@ def do_put_arrow_table(flight_client, table_name, arrow_table):
     writer.write(arrow_table)
     writer.close()
 
+    return flush_memory(flight_client)
+
+
+class IngestionReport:
+    """Times each phase of the ingestion for every file and batch so the rows
+    and bytes per second and the batch latencies can be written as a report."""
+
+    def __init__(self, table_name, measure_wire_size=False):
+        self.table_name = table_name
+        self.measure_wire_size = measure_wire_size
+        self.wire_size_in_bytes_before = 0
+        self.wire_size_in_bytes_after = 0
+        self.started_at = datetime.now().isoformat()
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        self.stream_count = 0
+        self.flush_count = 0
+
+        # Each sample is (phase, parquet_file, rows, size_in_bytes, seconds).
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def add(self, phase, parquet_file, rows, size_in_bytes, seconds):
+        with self.lock:
+            self.samples.append((phase, parquet_file, rows, size_in_bytes, seconds))
+
+    def add_wire_size(self, size_in_bytes_before, size_in_bytes_after):
+        # The size of the Arrow IPC messages without and with UploadOptions.
+        with self.lock:
+            self.wire_size_in_bytes_before += size_in_bytes_before
+            self.wire_size_in_bytes_after += size_in_bytes_after
+
+    def finish(self, model_table_writers):
+        self.end_time = time.perf_counter()
+        self.stream_count = sum(model_table_writer.stream_count for model_table_writer in model_table_writers)
+        self.flush_count = sum(model_table_writer.flush_count for model_table_writer in model_table_writers)
+
+    def summary(self):
+        elapsed_seconds = (self.end_time or time.perf_counter()) - self.start_time
+        written = [sample for sample in self.samples if sample[0] == "write"]
+        rows = sum(sample[2] for sample in written)
+        size_in_bytes = sum(sample[3] for sample in written)
+
+        # Cast samples only count the rows and bytes that had to be cast.
+        cast = [sample for sample in self.samples if sample[0] == "cast"]
+        cast_rows = sum(sample[2] for sample in cast)
+        cast_size_in_bytes = sum(sample[3] for sample in cast)
+
+        phases = {}
+        for phase in PHASES:
+            latencies = [sample[4] for sample in self.samples if sample[0] == phase]
+            phases[phase] = {
+                "seconds": sum(latencies),
+                "count": len(latencies),
+                "p50_seconds": percentile(latencies, 50),
+                "p95_seconds": percentile(latencies, 95),
+                "p99_seconds": percentile(latencies, 99),
+            }
+
+        # Closing streams and flushing are not specific to a file so they are only reported in total.
+        file_phases = ["decode", "cast", "write"]
+        files = defaultdict(
+            lambda: {"rows": 0, "bytes": 0, "cast_rows": 0, "cast_bytes": 0}
+            | {f"{phase}_seconds": 0.0 for phase in file_phases}
+        )
+        for phase, parquet_file, sample_rows, sample_size_in_bytes, seconds in self.samples:
+            if parquet_file is None:
+                continue
+            if phase == "write":
+                files[parquet_file]["rows"] += sample_rows
+                files[parquet_file]["bytes"] += sample_size_in_bytes
+            elif phase == "cast":
+                files[parquet_file]["cast_rows"] += sample_rows
+                files[parquet_file]["cast_bytes"] += sample_size_in_bytes
+            files[parquet_file][f"{phase}_seconds"] += seconds
+
+        return {
+            "table_name": self.table_name,
+            "started_at": self.started_at,
+            "elapsed_seconds": elapsed_seconds,
+            "rows": rows,
+            "bytes": size_in_bytes,
+            "cast_rows": cast_rows,
+            "cast_bytes": cast_size_in_bytes,
+            "rows_per_second": rows / elapsed_seconds if elapsed_seconds > 0 else 0.0,
+            "mib_per_second": size_in_bytes / 1024 / 1024 / elapsed_seconds if elapsed_seconds > 0 else 0.0,
+            "streams": self.stream_count,
+            "flushes": self.flush_count,
+            "wire_bytes_before": self.wire_size_in_bytes_before if self.measure_wire_size else None,
+            "wire_bytes_after": self.wire_size_in_bytes_after if self.measure_wire_size else None,
+            "phases": phases,
+            "files": [{"file": parquet_file} | totals for parquet_file, totals in files.items()],
+        }
+
+    def write(self, path):
+        # Apache Parquet reports contain one row per sample, others the summary as JSON.
+        if path.endswith(".parquet"):
+            phases, parquet_files, rows, sizes_in_bytes, seconds = zip(*self.samples) if self.samples else [()] * 5
+            samples = pyarrow.table(
+                {
+                    "phase": pyarrow.array(phases, pyarrow.string()),
+                    "file": pyarrow.array(parquet_files, pyarrow.string()),
+                    "rows": pyarrow.array(rows, pyarrow.int64()),
+                    "bytes": pyarrow.array(sizes_in_bytes, pyarrow.int64()),
+                    "seconds": pyarrow.array(seconds, pyarrow.float64()),
+                }
+            )
+            parquet.write_table(samples, path)
+        else:
+            with open(path, "w") as report_file:
+                json.dump(self.summary(), report_file, indent=2)
+
+
+def percentile(values, percent):
+    # Nearest-rank percentile, None is returned if there are no values.
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+class Checkpoint:
+    """Manifest of the files, and row groups in streaming mode, that have been
+    flushed to ModelarDB. Files and row groups are added as pending when all of
+    their data has been written and are only recorded as completed in the
+    manifest when the next flush succeeds. If path is None the manifest is only
+    kept in memory."""
+
+    def __init__(self, path, table_name, resume):
+        self.path = path
+        self.table_name = table_name
+        self.files = {}
+        self.pending_files = []
+        self.pending_row_groups = []
+        self.lock = threading.Lock()
+
+        if resume and path is not None and os.path.isfile(path):
+            with open(path) as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest["table_name"] != table_name:
+                raise ValueError(f"{path} is a checkpoint for {manifest['table_name']} not {table_name}")
+            self.files = manifest["files"]
+
+    def remaining_row_groups(self, parquet_file):
+        # None is returned if all of the file remains and [] if it is completed.
+        progress = self.files.get(os.path.abspath(parquet_file))
+        if progress is None or progress["size"] != os.path.getsize(parquet_file):
+            return None
+        elif progress["completed"]:
+            return []
+
+        row_group_count = parquet.ParquetFile(parquet_file).num_row_groups
+        completed = set(progress["row_groups"])
+        return [row_group for row_group in range(row_group_count) if row_group not in completed]
+
+    def add_row_group(self, parquet_file, row_group):
+        with self.lock:
+            self.pending_row_groups.append((parquet_file, row_group))
+
+    def add_file(self, parquet_file):
+        with self.lock:
+            self.pending_files.append(parquet_file)
+
+    def commit(self):
+        with self.lock:
+            self.commit_pending()
+
+    def commit_pending(self):
+        if not self.pending_files and not self.pending_row_groups:
+            return
+
+        for parquet_file, row_group in self.pending_row_groups:
+            self.progress(parquet_file)["row_groups"].append(row_group)
+
+        for parquet_file in self.pending_files:
+            self.progress(parquet_file)["completed"] = True
+
+        self.pending_files = []
+        self.pending_row_groups = []
+        if self.path is None:
+            return
+
+        try:
+            self.write()
+        except OSError as error:
+            # The data folder may be read-only, so the progress is still recorded somewhere.
+            fallback_path = Checkpoint.fallback_path(self.path)
+            print(f"Warning: cannot write checkpoint to {self.path} ({error}), writing it to {fallback_path}")
+            self.path = fallback_path
+            self.write()
+
+    @staticmethod
+    def fallback_path(path):
+        # Where the manifest is written if it cannot be written to path.
+        return os.path.join(tempfile.gettempdir(), os.path.basename(path))
+
+    def write(self):
+        # The manifest is replaced atomically so a crash cannot leave it partially written.
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as manifest_file:
+            json.dump({"table_name": self.table_name, "files": self.files}, manifest_file, indent=2)
+        os.replace(temporary_path, self.path)
+
+    def progress(self, parquet_file):
+        key = os.path.abspath(parquet_file)
+        size = os.path.getsize(parquet_file)
+        if key not in self.files or self.files[key]["size"] != size:
+            self.files[key] = {"size": size, "completed": False, "row_groups": []}
+        return self.files[key]
+
+
+@dataclass
+class FlushPolicy:
+    # When to execute FlushMemory: after each "file", after "rows" or "bytes"
+    # reach threshold since the last flush, at the "end" of the run, or "never".
+    kind: str = "file"
+    threshold: int = 0
+
+    @staticmethod
+    def parse(text: str) -> "FlushPolicy":
+        kind, _, threshold = text.partition(":")
+        if kind in ["file", "end", "never"] and not threshold:
+            return FlushPolicy(kind)
+        elif kind in ["rows", "bytes"] and threshold.isdigit() and int(threshold) > 0:
+            return FlushPolicy(kind, int(threshold))
+        raise argparse.ArgumentTypeError(
+            f"{text} is not file, end, never, rows:N, or bytes:N"
+        )
+
+    def is_reached(self, rows_since_flush: int, bytes_since_flush: int) -> bool:
+        if self.kind == "rows":
+            return rows_since_flush >= self.threshold
+        elif self.kind == "bytes":
+            return bytes_since_flush >= self.threshold
+        return False
+
+
+@dataclass
+class UploadOptions:
+    # How data is encoded before it is sent: compression is None, "lz4", or
+    # "zstd" and is applied to the Arrow IPC buffers, while dictionary_tags
+    # dictionary encodes the tag columns so repeated values are only sent once.
+    compression: str = None
+    dictionary_tags: bool = False
+
+    def write_options(self):
+        return pyarrow.ipc.IpcWriteOptions(compression=self.compression)
+
+    def call_options(self):
+        return flight.FlightCallOptions(write_options=self.write_options())
+
+    def encode(self, record_batch):
+        if not self.dictionary_tags:
+            return record_batch
+
+        columns = [
+            pc.dictionary_encode(column) if pyarrow.types.is_string(column.type) else column
+            for column in record_batch.columns
+        ]
+        return pyarrow.RecordBatch.from_arrays(columns, names=record_batch.schema.names)
+
+
+def ipc_size_in_bytes(record_batch, write_options):
+    # Serialize the batch to a sink that only counts the bytes written to it.
+    sink = pyarrow.MockOutputStream()
+    with pyarrow.ipc.new_stream(sink, record_batch.schema, options=write_options) as writer:
+        writer.write_batch(record_batch)
+    return sink.size()
+
+
+class ModelTableWriter:
+    """Uploads data to a model table through do_put and flushes it according to
+    a FlushPolicy. If single_stream is True the same do_put stream is used for
+    all files, otherwise a new stream is used for each file."""
+
+    def __init__(
+        self,
+        flight_client,
+        table_name,
+        flush_policy=FlushPolicy(),
+        single_stream=False,
+        checkpoint=None,
+        report=None,
+        upload_options=UploadOptions(),
+    ):
+        self.flight_client = flight_client
+        self.table_name = table_name
+        self.flush_policy = flush_policy
+        self.single_stream = single_stream
+        self.checkpoint = checkpoint
+        self.report = report
+        self.upload_options = upload_options
+
+        self.writer = None
+        self.schema = None
+        self.rows_since_flush = 0
+        self.bytes_since_flush = 0
+        self.stream_count = 0
+        self.flush_count = 0
+
+    def write_table(self, arrow_table, parquet_file=None):
+        for record_batch in arrow_table.to_batches():
+            self.write_batch(record_batch, parquet_file)
+
+    def write_batch(self, record_batch, parquet_file=None):
+        encoded_record_batch = self.upload_options.encode(record_batch)
+
+        # A stream only accepts batches with the schema it was opened with.
+        if self.writer is not None and encoded_record_batch.schema != self.schema:
+            self.close_stream()
+
+        if self.writer is None:
+            upload_descriptor = flight.FlightDescriptor.for_path(self.table_name)
+            self.writer, _ = self.flight_client.do_put(
+                upload_descriptor, encoded_record_batch.schema, options=self.upload_options.call_options()
+            )
+            self.schema = encoded_record_batch.schema
+            self.stream_count += 1
+
+        start_time = time.perf_counter()
+        self.writer.write_batch(encoded_record_batch)
+        write_seconds = time.perf_counter() - start_time
+
+        # The batch is only serialized again to measure its size after it is timed.
+        if self.report is not None:
+            self.report.add("write", parquet_file, record_batch.num_rows, record_batch.nbytes, write_seconds)
+            if self.report.measure_wire_size:
+                self.report.add_wire_size(
+                    ipc_size_in_bytes(record_batch, pyarrow.ipc.IpcWriteOptions()),
+                    ipc_size_in_bytes(encoded_record_batch, self.upload_options.write_options()),
+                )
+        self.rows_since_flush += record_batch.num_rows
+        self.bytes_since_flush += record_batch.nbytes
+
+        if self.flush_policy.is_reached(self.rows_since_flush, self.bytes_since_flush):
+            self.flush()
+
+    def end_file(self):
+        if not self.single_stream:
+            self.close_stream()
+
+        if self.flush_policy.kind == "file":
+            self.flush()
+
+    def close(self):
+        self.close_stream()
+
+        # Data remaining after the last row or byte based flush is also flushed.
+        if self.flush_policy.kind in ["end", "rows", "bytes"] and (
+            self.rows_since_flush > 0 or self.checkpoint is not None and self.checkpoint.pending_files
+        ):
+            self.flush()
+
+    def flush(self):
+        # The stream is closed first so ModelarDB has received all of the data
+        # written to it before it is flushed, it is reopened on the next write.
+        self.close_stream()
+        start_time = time.perf_counter()
+        flush_memory(self.flight_client)
+        if self.report is not None:
+            self.report.add("flush", None, self.rows_since_flush, self.bytes_since_flush, time.perf_counter() - start_time)
+        if self.checkpoint is not None:
+            self.checkpoint.commit()
+        self.rows_since_flush = 0
+        self.bytes_since_flush = 0
+        self.flush_count += 1
+
+    def close_stream(self):
+        if self.writer is not None:
+            start_time = time.perf_counter()
+            self.writer.close()
+            self.writer = None
+            if self.report is not None:
+                self.report.add("close", None, 0, 0, time.perf_counter() - start_time)
+
+
+def flush_memory(flight_client):
     # Flush the data to disk.
     action = flight.Action("FlushMemory", b"")
     result = flight_client.do_action(action)
     return list(result)
 
 
+def prefetch(iterator, depth):
+    # Consume iterator on a separate thread so the next items are computed while
+    # the current item is used, with at most depth items waiting in the queue.
+    items = queue.Queue(maxsize=depth)
+    end_of_iterator = object()
+
+    def produce():
+        try:
+            for item in iterator:
+                items.put((item, None))
+        except Exception as exception:
+            items.put((None, exception))
+        items.put((end_of_iterator, None))
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item, exception = items.get()
+        if exception is not None:
+            raise exception
+        if item is end_of_iterator:
+            return
+        yield item
+
+
+def read_ahead(tasks, reader_count, depth):
+    # Execute the tasks on reader_count threads and return their results in the
+    # order of tasks. At most depth results are computed ahead of the consumer.
+    with ThreadPoolExecutor(max_workers=reader_count) as executor:
+        futures = (executor.submit(task) for task in tasks)
+        for future in prefetch(futures, depth):
+            yield future.result()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Ingest Apache Parquet files into a model table in ModelarDB."
+    )
+    parser.add_argument("host", help="host and port of ModelarDB, e.g., 127.0.0.1:9999")
+    parser.add_argument("table", help="name of the model table to ingest into")
+    parser.add_argument("parquet_file_or_folder", help="Apache Parquet file or folder of files")
+    parser.add_argument("relative_error_bound", nargs="?", default="0.0")
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="read and upload each file in batches instead of reading the entire file, memory use is bounded by"
+        " the size of the row groups in the files as each row group is decoded entirely",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"maximum number of rows per batch in streaming mode (default: {DEFAULT_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=0,
+        help="number of files, or batches in streaming mode, to read ahead while uploading (default: 0, disabled)",
+    )
+    parser.add_argument(
+        "--readers",
+        type=int,
+        default=1,
+        help="number of threads reading files ahead when --prefetch is used without --streaming (default: 1)",
+    )
+    parser.add_argument(
+        "--single-stream",
+        action="store_true",
+        help="upload all files through one do_put stream instead of one stream per file, a flush closes the stream"
+        " so it cannot be used with --flush-policy file and changes its default to end",
+    )
+    parser.add_argument(
+        "--flush-policy",
+        type=FlushPolicy.parse,
+        help="when to flush: file, rows:N, bytes:N, end, or never (default: file, or end with --single-stream)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        help="write the checkpoint manifest to this path (default: .TABLE.checkpoint.json next to the data with"
+        " --resume, otherwise it is not written)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip the files and row groups recorded as completed in the checkpoint manifest and keep it updated",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of concurrent do_put streams, each with its own connection, that upload the files,"
+        " or the row groups of a single file, and are flushed once at the end, so each worker uses a single"
+        " stream and --flush-policy, --prefetch, and --readers are not supported (default: 1)",
+    )
+    parser.add_argument(
+        "--report",
+        help="write the time spent in each phase and the throughput to a .json summary or a .parquet file of samples",
+    )
+    parser.add_argument(
+        "--report-wire-size",
+        action="store_true",
+        help="also report the Arrow IPC size of the batches with and without --ipc-compression and --dictionary-tags,"
+        " each batch is serialized twice more to measure it so the run takes longer",
+    )
+    parser.add_argument(
+        "--columns",
+        nargs="+",
+        metavar="COLUMN",
+        help="field columns to ingest, the timestamp and tag columns are always ingested (default: all)",
+    )
+    parser.add_argument("--start", help="only ingest rows with a timestamp at or after this ISO 8601 time")
+    parser.add_argument("--end", help="only ingest rows with a timestamp before this ISO 8601 time")
+    parser.add_argument(
+        "--tag",
+        action="append",
+        default=[],
+        metavar="TAG=VALUE",
+        help="only ingest rows where the tag column TAG is VALUE, can be repeated",
+    )
+    parser.add_argument(
+        "--ipc-compression",
+        choices=["lz4", "zstd"],
+        help="compress the Arrow IPC buffers sent to ModelarDB (default: uncompressed)",
+    )
+    parser.add_argument(
+        "--dictionary-tags",
+        action="store_true",
+        help="dictionary encode the tag columns before they are sent, requires that ModelarDB accepts them",
+    )
+    arguments = parser.parse_args()
+
+    # The workers each upload through one stream and are flushed together once at the end.
+    if arguments.workers > 1:
+        if arguments.flush_policy is not None and arguments.flush_policy.kind != "end":
+            parser.error("--workers only supports --flush-policy end as the workers are flushed once at the end")
+        if arguments.prefetch > 0 or arguments.readers != 1:
+            parser.error("--workers cannot be used with --prefetch or --readers as each worker reads its own files")
+
+    # Flushing after each file closes the stream so --single-stream would have no effect.
+    if arguments.flush_policy is None:
+        arguments.flush_policy = FlushPolicy("end") if arguments.single_stream else FlushPolicy()
+    elif arguments.single_stream and arguments.flush_policy.kind == "file":
+        parser.error("--single-stream cannot be used with --flush-policy file as each flush closes the stream")
+
+    if arguments.report_wire_size and arguments.report is None:
+        parser.error("--report-wire-size requires --report")
+
+    tags = {}
+    for tag in arguments.tag:
+        name, separator, value = tag.partition("=")
+        if not separator:
+            parser.error(f"--tag {tag} is not TAG=VALUE")
+        tags[name] = value
+    arguments.row_filter = RowFilter(arguments.columns, arguments.start, arguments.end, tags)
+    arguments.upload_options = UploadOptions(arguments.ipc_compression, arguments.dictionary_tags)
+    return arguments
+
+
 # Main Function.
-if __name__ == "__main__":
-    if len(sys.argv) != 4 and len(sys.argv) != 5:
-        print(f"usage: {sys.argv[0]} host table parquet_file_or_folder [relative_error_bound]")
-        sys.exit(1)
+def main():
+    arguments = parse_arguments()
 
-    flight_client = flight.FlightClient(f"grpc://{sys.argv[1]}")
-    table_name = sys.argv[2]
-    error_bound = sys.argv[4] if len(sys.argv) == 5 else "0.0"
+    flight_client = flight.FlightClient(f"grpc://{arguments.host}")
+    table_name = arguments.table
+    error_bound = arguments.relative_error_bound
 
-    if os.path.isdir(sys.argv[3]):
-        parquet_files = glob.glob(sys.argv[3] + os.sep + "*.parquet")
+    if os.path.isdir(arguments.parquet_file_or_folder):
+        parquet_files = glob.glob(arguments.parquet_file_or_folder + os.sep + "*.parquet")
         parquet_files.sort()  # Makes ingestion order more intuitive.
-    elif os.path.isfile(sys.argv[3]):
-        parquet_files = [sys.argv[3]]
+    elif os.path.isfile(arguments.parquet_file_or_folder):
+        parquet_files = [arguments.parquet_file_or_folder]
     else:
         raise ValueError("parquet_file_or_folder is not a file or a folder")
 
-    arrow_table = read_parquet_file_or_folder(parquet_files[0])
     if not table_exists(flight_client, table_name):
-        create_model_table(flight_client, table_name, arrow_table.schema, error_bound)
+        create_model_table(flight_client, table_name, read_safe_schema(parquet_files[0], arguments.row_filter), error_bound)
+
+    # The manifest is only written to disk if it is requested so the data folder can be read-only.
+    checkpoint_path = arguments.checkpoint
+    if checkpoint_path is None and arguments.resume:
+        data_folder = os.path.dirname(os.path.abspath(parquet_files[0]))
+        checkpoint_path = os.path.join(data_folder, f".{table_name}.checkpoint.json")
 
-    for index, parquet_file in enumerate(parquet_files):
-        print(f"- Processing {parquet_file} ({index + 1} of {len(parquet_files)})")
-        arrow_table = read_parquet_file_or_folder(parquet_file)
-        do_put_arrow_table(flight_client, table_name, arrow_table)
\ No newline at end of file
+    # A manifest that could not be written to its path was written to the fallback path instead.
+    if arguments.resume and not os.path.isfile(checkpoint_path):
+        if os.path.isfile(Checkpoint.fallback_path(checkpoint_path)):
+            checkpoint_path = Checkpoint.fallback_path(checkpoint_path)
+    checkpoint = Checkpoint(checkpoint_path, table_name, arguments.resume)
+
+    # Files that are partially completed only have their remaining row groups read.
+    remaining_row_groups = {
+        parquet_file: checkpoint.remaining_row_groups(parquet_file) for parquet_file in parquet_files
+    }
+    if arguments.resume:
+        completed_files = [file for file, row_groups in remaining_row_groups.items() if row_groups == []]
+        print(f"Resuming from {checkpoint_path}, skipping {len(completed_files)} completed files")
+
+    report = IngestionReport(table_name, arguments.report_wire_size)
+    remaining_files = [file for file in parquet_files if remaining_row_groups[file] != []]
+    if arguments.workers > 1:
+        model_table_writers = ingest_concurrently(
+            arguments, flight_client, remaining_files, remaining_row_groups, checkpoint, report
+        )
+    else:
+        model_table_writers = [
+            ingest_serially(
+                arguments, flight_client, parquet_files, remaining_files, remaining_row_groups, checkpoint, report
+            )
+        ]
+    report.finish(model_table_writers)
+
+    summary = report.summary()
+    print(
+        f"Uploaded {len(remaining_files)} files using {summary['streams']} streams and {summary['flushes']} flushes"
+        f" in {summary['elapsed_seconds']:.2f} s ({summary['rows_per_second']:.0f} rows/s,"
+        f" {summary['mib_per_second']:.2f} MiB/s)"
+    )
+    if arguments.report is not None:
+        report.write(arguments.report)
+
+
+def ingest_serially(
+    arguments, flight_client, parquet_files, remaining_files, remaining_row_groups, checkpoint, report
+):
+    model_table_writer = ModelTableWriter(
+        flight_client,
+        arguments.table,
+        arguments.flush_policy,
+        arguments.single_stream,
+        checkpoint,
+        report,
+        arguments.upload_options,
+    )
+
+    if arguments.streaming:
+        # Batches are tagged with their file and row group so the end of each is known. Each
+        # file ends with a None batch so files without rows matching the filter are completed.
+        file_batches = (
+            (parquet_file, row_group, record_batch)
+            for parquet_file in remaining_files
+            for row_group, record_batch in itertools.chain(
+                read_parquet_file_batches(
+                    parquet_file, arguments.batch_size, remaining_row_groups[parquet_file], report, arguments.row_filter
+                ),
+                [(None, None)],
+            )
+        )
+        if arguments.prefetch > 0:
+            file_batches = prefetch(file_batches, arguments.prefetch)
+
+        for parquet_file, batches in itertools.groupby(file_batches, key=lambda file_batch: file_batch[0]):
+            index = parquet_files.index(parquet_file)
+            print(f"- Processing {parquet_file} ({index + 1} of {len(parquet_files)})")
+            for row_group, row_group_batches in itertools.groupby(batches, key=lambda file_batch: file_batch[1]):
+                if row_group is None:
+                    continue
+                for _, _, record_batch in row_group_batches:
+                    model_table_writer.write_batch(record_batch, parquet_file)
+                checkpoint.add_row_group(parquet_file, row_group)
+            checkpoint.add_file(parquet_file)
+            model_table_writer.end_file()
+    else:
+        tasks = [
+            functools.partial(
+                read_parquet_file_or_folder,
+                parquet_file,
+                remaining_row_groups[parquet_file],
+                report,
+                arguments.row_filter,
+            )
+            for parquet_file in remaining_files
+        ]
+        if arguments.prefetch > 0:
+            arrow_tables = read_ahead(tasks, arguments.readers, arguments.prefetch)
+        else:
+            arrow_tables = (task() for task in tasks)
+
+        for parquet_file, arrow_table in zip(remaining_files, arrow_tables):
+            index = parquet_files.index(parquet_file)
+            print(f"- Processing {parquet_file} ({index + 1} of {len(parquet_files)})")
+            model_table_writer.write_table(arrow_table, parquet_file)
+            checkpoint.add_file(parquet_file)
+            model_table_writer.end_file()
+
+    model_table_writer.close()
+    return model_table_writer
+
+
+def ingest_concurrently(arguments, flight_client, remaining_files, remaining_row_groups, checkpoint, report):
+    # Work units are (parquet_file, row_groups, is_entire_file). A single file is
+    # split into its row groups so it can also be uploaded by multiple workers.
+    work_units = queue.Queue()
+    if len(remaining_files) == 1:
+        parquet_file = remaining_files[0]
+        row_groups = remaining_row_groups[parquet_file]
+        if row_groups is None:
+            row_groups = range(parquet.ParquetFile(parquet_file).num_row_groups)
+        for row_group in arguments.row_filter.row_groups(parquet_file, row_groups):
+            work_units.put((parquet_file, [row_group], False))
+    else:
+        for parquet_file in remaining_files:
+            work_units.put((parquet_file, remaining_row_groups[parquet_file], True))
+
+    with ThreadPoolExecutor(max_workers=arguments.workers) as executor:
+        futures = [
+            executor.submit(ingest_work_units, arguments, work_units, checkpoint, report)
+            for _ in range(arguments.workers)
+        ]
+
+    # The data uploaded by the workers is flushed once, even if a worker failed,
+    # so the work units that were completed are recorded in the checkpoint.
+    model_table_writer = ModelTableWriter(flight_client, arguments.table, checkpoint=checkpoint, report=report)
+    try:
+        model_table_writers = [future.result() for future in futures]
+        if len(remaining_files) == 1:
+            checkpoint.add_file(remaining_files[0])
+    finally:
+        model_table_writer.flush()
+    return model_table_writers + [model_table_writer]
+
+
+def ingest_work_units(arguments, work_units, checkpoint, report):
+    # Each worker uses its own connection and stream and never flushes.
+    flight_client = flight.FlightClient(f"grpc://{arguments.host}")
+    model_table_writer = ModelTableWriter(
+        flight_client, arguments.table, FlushPolicy("never"), True, checkpoint, report, arguments.upload_options
+    )
+
+    try:
+        while True:
+            try:
+                parquet_file, row_groups, is_entire_file = work_units.get_nowait()
+            except queue.Empty:
+                break
+
+            if is_entire_file:
+                print(f"- Processing {parquet_file}")
+            else:
+                print(f"- Processing {parquet_file} row groups {row_groups}")
+
+            if arguments.streaming:
+                batches = read_parquet_file_batches(
+                    parquet_file, arguments.batch_size, row_groups, report, arguments.row_filter
+                )
+                for row_group, row_group_batches in itertools.groupby(batches, key=lambda batch: batch[0]):
+                    for _, record_batch in row_group_batches:
+                        model_table_writer.write_batch(record_batch, parquet_file)
+                    checkpoint.add_row_group(parquet_file, row_group)
+            else:
+                arrow_table = read_parquet_file_or_folder(parquet_file, row_groups, report, arguments.row_filter)
+                model_table_writer.write_table(arrow_table, parquet_file)
+                if not is_entire_file:
+                    for row_group in row_groups:
+                        checkpoint.add_row_group(parquet_file, row_group)
+
+            if is_entire_file:
+                checkpoint.add_file(parquet_file)
+    finally:
+        model_table_writer.close()
+
+    return model_table_writer
+
+
+if __name__ == "__main__":
+    main()
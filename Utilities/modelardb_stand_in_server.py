@@ -0,0 +1,261 @@
+"""Stand-in for the Apache Arrow Flight interface of modelardbd that keeps all data
+in memory. It supports the subset of the interface used by the scripts in this
+repository: CREATE MODEL TABLE and simple SELECT tickets for do_get, do_put,
+list_flights, and the FlushMemory action. SELECT supports columns, COUNT, and
+SUM(CASE WHEN ... THEN 1 ELSE 0 END) with predicates joined by AND. Latency and
+a bandwidth limit can be injected so the throughput of the Python tooling can be
+benchmarked and compared across changes without a build of ModelarDB.
+"""
+import re
+import time
+import argparse
+import threading
+
+import pyarrow
+import pyarrow.compute as pc
+from pyarrow import flight
+
+
+CREATE_MODEL_TABLE_PATTERN = re.compile(
+    r"^\s*CREATE\s+MODEL\s+TABLE\s+(?P<table>\w+)\s*\((?P<columns>.*)\)\s*;?\s*$", re.IGNORECASE | re.DOTALL
+)
+COLUMN_PATTERN = re.compile(r"^\s*`?(?P<name>[^`]+?)`?\s+(?P<type>TIMESTAMP|FIELD|TAG)\b", re.IGNORECASE)
+SELECT_PATTERN = re.compile(
+    r"^\s*SELECT\s+(?P<projection>.+?)\s+FROM\s+(?P<table>\w+)"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?(?:\s+LIMIT\s+(?P<limit>\d+))?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+PREDICATE_PATTERN = re.compile(r"^\s*(?P<column>\w+)\s*(?P<operator>==|=|<>|!=|<=|>=|<|>)\s*(?P<literal>.+?)\s*$")
+ARROW_CAST_PATTERN = re.compile(r"^arrow_cast\(\s*'(?P<value>[^']*)'\s*,\s*'\w+'\s*\)$", re.IGNORECASE)
+COUNT_PATTERN = re.compile(r"^COUNT\(\s*(?P<column>\*|\w+)\s*\)$", re.IGNORECASE)
+SUM_CASE_PATTERN = re.compile(
+    r"^SUM\(\s*CASE\s+WHEN\s+(?P<condition>.+?)\s+THEN\s+1\s+ELSE\s+0\s+END\s*\)$", re.IGNORECASE | re.DOTALL
+)
+
+COMPARISONS = {
+    "=": pc.equal,
+    "==": pc.equal,
+    "<>": pc.not_equal,
+    "!=": pc.not_equal,
+    "<": pc.less,
+    "<=": pc.less_equal,
+    ">": pc.greater,
+    ">=": pc.greater_equal,
+}
+
+
+def get_safe_col_name(col_name):
+    # ModelarDB returns column names in lower case with spaces replaced.
+    return col_name.lower().replace(" ", "_")
+
+
+class StandInServer(flight.FlightServerBase):
+    def __init__(self, location, latency_in_seconds=0.0, bandwidth_in_bytes_per_second=0.0):
+        super().__init__(location)
+        self.latency_in_seconds = latency_in_seconds
+        self.bandwidth_in_bytes_per_second = bandwidth_in_bytes_per_second
+
+        # Each model table is stored as its schema and the batches put into it.
+        self.tables = {}
+        self.flush_count = 0
+        self.lock = threading.Lock()
+
+    def list_flights(self, context, criteria):
+        self.delay()
+        with self.lock:
+            tables = list(self.tables.items())
+
+        for table_name, (schema, _record_batches) in tables:
+            descriptor = flight.FlightDescriptor.for_path(table_name)
+            yield flight.FlightInfo(schema, descriptor, [], -1, -1)
+
+    def do_get(self, context, ticket):
+        self.delay()
+        sql = ticket.ticket.decode("UTF-8")
+
+        match = CREATE_MODEL_TABLE_PATTERN.match(sql)
+        if match:
+            return flight.RecordBatchStream(self.create_model_table(match))
+
+        match = SELECT_PATTERN.match(sql)
+        if match:
+            result = self.select(match)
+            return flight.GeneratorStream(result.schema, self.throttle(result.to_batches()))
+
+        raise flight.FlightServerError(f"Unsupported query: {sql}")
+
+    def do_put(self, context, descriptor, reader, writer):
+        self.delay()
+        table_name = descriptor.path[0].decode("UTF-8")
+        with self.lock:
+            if table_name not in self.tables:
+                raise flight.FlightServerError(f"Unknown table: {table_name}")
+            schema, record_batches = self.tables[table_name]
+
+        for chunk in self.throttle(chunk.data for chunk in reader):
+            # Columns are matched by name as the names are normalized when the table is created.
+            columns = {get_safe_col_name(name): column for name, column in zip(chunk.schema.names, chunk.columns)}
+            if set(columns) != set(schema.names):
+                raise flight.FlightServerError(f"Columns {chunk.schema.names} do not match {schema.names}")
+            columns = [columns[field.name].cast(field.type) for field in schema]
+            record_batch = pyarrow.RecordBatch.from_arrays(columns, schema=schema)
+            with self.lock:
+                record_batches.append(record_batch)
+
+    def do_action(self, context, action):
+        self.delay()
+        if action.type == "FlushMemory":
+            with self.lock:
+                self.flush_count += 1
+            return []
+        raise flight.FlightServerError(f"Unsupported action: {action.type}")
+
+    def list_actions(self, context):
+        return [("FlushMemory", "Counts the flush as all data is kept in memory.")]
+
+    def create_model_table(self, match):
+        fields = []
+        for column in split_top_level(match.group("columns")):
+            column_match = COLUMN_PATTERN.match(column)
+            if not column_match:
+                raise flight.FlightServerError(f"Unsupported column: {column}")
+
+            name = get_safe_col_name(column_match.group("name"))
+            column_type = column_match.group("type").upper()
+            if column_type == "TIMESTAMP":
+                fields.append(pyarrow.field(name, pyarrow.timestamp("us")))
+            elif column_type == "FIELD":
+                fields.append(pyarrow.field(name, pyarrow.float32()))
+            else:
+                fields.append(pyarrow.field(name, pyarrow.string()))
+
+        with self.lock:
+            self.tables.setdefault(match.group("table"), (pyarrow.schema(fields), []))
+        return pyarrow.table({})
+
+    def select(self, match):
+        table_name = match.group("table")
+        with self.lock:
+            if table_name not in self.tables:
+                raise flight.FlightServerError(f"Unknown table: {table_name}")
+            schema, record_batches = self.tables[table_name]
+            table = pyarrow.Table.from_batches(list(record_batches), schema=schema)
+
+        if match.group("where"):
+            table = table.filter(evaluate_condition(table, match.group("where")))
+
+        projection = [item.strip() for item in split_top_level(match.group("projection"))]
+        if any(COUNT_PATTERN.match(item) or SUM_CASE_PATTERN.match(item) for item in projection):
+            table = aggregate(table, projection)
+        elif projection != ["*"]:
+            table = table.select([find_column(table, name) for name in projection])
+
+        if match.group("limit"):
+            table = table.slice(0, int(match.group("limit")))
+        return table
+
+    def throttle(self, record_batches):
+        # Sleep so the batches are not transferred faster than the bandwidth limit.
+        for record_batch in record_batches:
+            if self.bandwidth_in_bytes_per_second > 0:
+                time.sleep(record_batch.nbytes / self.bandwidth_in_bytes_per_second)
+            yield record_batch
+
+    def delay(self):
+        if self.latency_in_seconds > 0:
+            time.sleep(self.latency_in_seconds)
+
+
+def split_top_level(text):
+    # Split on commas that are not inside parentheses, e.g., in FIELD(1.0%).
+    parts, depth, start = [], 0, 0
+    for index, character in enumerate(text):
+        if character == "(":
+            depth += 1
+        elif character == ")":
+            depth -= 1
+        elif character == "," and depth == 0:
+            parts.append(text[start:index])
+            start = index + 1
+    parts.append(text[start:])
+    return [part for part in parts if part.strip()]
+
+
+def find_column(table, name):
+    for column_name in table.column_names:
+        if column_name.lower() == name.lower():
+            return column_name
+    raise flight.FlightServerError(f"Unknown column: {name}")
+
+
+def parse_literal(literal):
+    arrow_cast_match = ARROW_CAST_PATTERN.match(literal)
+    if arrow_cast_match:
+        return float(arrow_cast_match.group("value"))
+    elif literal.startswith("'") and literal.endswith("'"):
+        return literal[1:-1]
+    return float(literal)
+
+
+def evaluate_condition(table, condition):
+    mask = None
+    for predicate in re.split(r"\s+AND\s+", condition, flags=re.IGNORECASE):
+        predicate_mask = evaluate_predicate(table, predicate)
+        mask = predicate_mask if mask is None else pc.and_(mask, predicate_mask)
+    return mask
+
+
+def evaluate_predicate(table, predicate):
+    match = PREDICATE_PATTERN.match(predicate)
+    if not match:
+        raise flight.FlightServerError(f"Unsupported predicate: {predicate}")
+
+    column = table.column(find_column(table, match.group("column")))
+    literal = pyarrow.scalar(parse_literal(match.group("literal"))).cast(column.type)
+    return COMPARISONS[match.group("operator")](column, literal)
+
+
+def aggregate(table, projection):
+    counts = {}
+    for item in projection:
+        count_match = COUNT_PATTERN.match(item)
+        sum_case_match = SUM_CASE_PATTERN.match(item)
+        if count_match:
+            column = count_match.group("column")
+            if column == "*":
+                counts[item] = [table.num_rows]
+            else:
+                counts[item] = [table.num_rows - table.column(find_column(table, column)).null_count]
+        elif sum_case_match:
+            # Rows where the condition is NULL are counted as 0 and SUM of no rows is NULL like in SQL.
+            mask = evaluate_condition(table, sum_case_match.group("condition"))
+            counts[item] = [(pc.sum(mask).as_py() or 0) if table.num_rows > 0 else None]
+        else:
+            raise flight.FlightServerError(f"Cannot mix aggregates with columns: {item}")
+    return pyarrow.table(counts, schema=pyarrow.schema([(item, pyarrow.int64()) for item in counts]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory stand-in for the Apache Arrow Flight interface of modelardbd.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every request")
+    parser.add_argument(
+        "--bandwidth-mib-per-second",
+        type=float,
+        default=0.0,
+        help="maximum speed data is received and sent at, 0 means unlimited",
+    )
+    arguments = parser.parse_args()
+
+    server = StandInServer(
+        f"grpc://{arguments.host}:{arguments.port}",
+        arguments.latency_ms / 1000,
+        arguments.bandwidth_mib_per_second * 1024 * 1024,
+    )
+    print(f"Serving on grpc://{arguments.host}:{arguments.port}")
+    server.serve()
+
+
+if __name__ == "__main__":
+    main()